@@ -2,6 +2,8 @@ __author__ = 'Greg'
 import model
 import math
 
+import numpy as np
+
 # Constants
 TOLW = .02
 NVECTOR = [n / 100.0 for n in range(0, 1000)]
@@ -197,6 +199,190 @@ def check_maximize():
         print "MAX10", answer_low, answer_high
         #with ctilde, test both
 
+def check_maximize_methods():
+    """
+    :return: test_results
+    """
+    #note:  exact methods are not limited by nvector, so compare to more places.
+    test_indiv = model.Individual("L", .4, .3,
+                                  .15, 1.3 * .15, 0,
+                                  1, 2, 2)
+    test_indiv.update_age(test_indiv._age_middle)
+    for method in ["adaptive", "golden", "newton", "table"]:
+        answer_low, answer_high = test_indiv.maximize_n([2], [1], 4, 1, .75, .05, method=method)
+        if not (round(answer_low, 6), round(answer_high, 6)) == (round(.3 / .15, 6), 0):
+            print "METH1", method, (answer_low, answer_high)
+
+        answer_low, answer_high = test_indiv.maximize_n([2, 12], [.5, 1], 1, 4, .75, .05, method=method)
+        if not (round(answer_low, 6), round(answer_high, 6)) == (0, round(.3 / (.15*1.3), 6)):
+            print "METH2", method, (answer_low, answer_high)
+
+        answer_low, answer_high = test_indiv.maximize_n([4, 7], [1, 3], 2 * test_indiv._tau_u,
+                                                        2 * test_indiv._tau_s - .01, .75, .05, method=method)
+        low = (.3 / (.15 + .15*1.3*.75))
+        if not (round(answer_low, 6), round(answer_high, 6)) == (round(low, 6), round(.75 * low, 6)):
+            print "METH3", method, (answer_low, answer_high), (low, .75 * low)
+
+    # with CTILDE, periods with different subsistence shares
+    test_indiv = model.Individual("L", .2, .2,
+                                  .1, .1, .5,
+                                  1, 2, 2)
+    test_indiv.update_age(test_indiv._age_middle)
+    answer_grid = test_indiv.maximize_n([1, 2], [1, 1], 1, 1, 1, .05, nvector=NVECTOR)
+    answer_golden = test_indiv.maximize_n([1, 2], [1, 1], 1, 1, 1, .05, method="golden")
+    answer_newton = test_indiv.maximize_n([1, 2], [1, 1], 1, 1, 1, .05, method="newton")
+    if not abs(answer_golden[0] - answer_newton[0]) < 1e-6:
+        print "METH4", answer_golden, answer_newton
+    if not abs(answer_grid[0] - answer_newton[0]) < .01:
+        print "METH5", answer_grid, answer_newton
+        #grid answer should be within grid resolution.
+    answer_adaptive = test_indiv.maximize_n([1, 2], [1, 1], 1, 1, 1, .05, method="adaptive")
+    if not abs(answer_adaptive[0] - answer_newton[0]) < 1e-6:
+        print "METH6", answer_adaptive, answer_newton
+
+    # the adaptive grid grows past the top of nvector
+    answer_adaptive = test_indiv.maximize_n([1, 2], [1, 1], 1, 1, 1, .05, nvector=[0, .1], method="adaptive")
+    if not abs(answer_adaptive[0] - answer_newton[0]) < 1e-6:
+        print "METH7", answer_adaptive, answer_newton
+
+    # a feasible interval narrower than one step of nvector
+    test_indiv = model.Individual("low", tau_u=.15, tau_s=.195, ctilde=.1)
+    test_indiv.update_age(1)
+    answer_newton = test_indiv.maximize_n([1.], [9.9], 4., 1., .75, method="newton")
+    for method in ["adaptive", "golden"]:
+        answer = test_indiv.maximize_n([1.], [9.9], 4., 1., .75, method=method)
+        if not abs(answer[0] - answer_newton[0]) < 1e-6:
+            print "METH8", method, answer, answer_newton
+
+def check_cache():
+    """
+    :return: test_results
+    """
+    test_indiv = model.Individual("L", .4, .3,
+                                  .15, 1.3 * .15, 0,
+                                  1, 2, 2)
+    test_indiv.update_age(test_indiv._age_middle)
+    test_cache = model.HouseholdCache(maxsize=2, tolerance=1e-6)
+    answer = test_indiv.maximize_n([2], [1], 4, 1, .75, .05, method="newton", cache=test_cache)
+    again = test_indiv.maximize_n([2 + 1e-9], [1], 4, 1, .75, .05, method="newton", cache=test_cache)
+    if not (again == answer and test_cache.get_stats() == (1, 1, 1)):
+        print "CACHE1", answer, again, test_cache.get_stats()
+        #note:  inputs within tolerance share an answer.
+
+    test_indiv.maximize_n([3], [1], 4, 1, .75, .05, method="newton", cache=test_cache)
+    test_indiv.maximize_n([4], [1], 4, 1, .75, .05, method="newton", cache=test_cache)
+    test_indiv.maximize_n([2], [1], 4, 1, .75, .05, method="newton", cache=test_cache)
+    if not test_cache.get_stats() == (1, 4, 2):
+        print "CACHE2", test_cache.get_stats()
+        #note:  oldest answer was dropped.
+
+    test_indiv.maximize_n([2], [1], 4, 1, .75, .05, cache=test_cache)
+    if not test_cache.get_stats() == (1, 5, 2):
+        print "CACHE3", test_cache.get_stats()
+        #note:  methods are cached separately.
+
+
+def check_table():
+    """
+    :return: test_results
+    """
+    test_indiv = model.Individual("L", .2, .2,
+                                  .1, .1, .5,
+                                  1, 2, 2)
+    test_indiv.update_age(test_indiv._age_middle)
+    answer_table = test_indiv.maximize_n([1, 2], [1, 1], 1, 1, 1, .05, method="table")
+    answer_newton = test_indiv.maximize_n([1, 2], [1, 1], 1, 1, 1, .05, method="newton")
+    if not abs(answer_table[0] - answer_newton[0]) < model.TABLE_TOLERANCE:
+        print "TABLE1", answer_table, answer_newton
+
+    # lookups within tolerance, or solved exactly
+    test_table = model.PolicyTable(.2, .2, 2, size=5, tolerance=1e-9)
+    wage = np.array([[1., 2.], [1., 1.], [3., 1.5]])
+    cost = np.array([.1, .1, .2])
+    answer = test_table.solve(np.array([.5, .5, .5]), cost, np.array([1., 1., 0.]), wage, np.ones((3, 2)))
+    exact = model._newton_batch(np.array([.2] * 3), np.array([.2] * 3), np.array([.5] * 3), cost,
+                                np.array([1., 1., 0.]), wage, np.ones((3, 2)), model.XTOL)
+    if not (list(answer) == list(exact) and test_table.get_stats() == (3, 1)):
+        print "TABLE2", answer, exact, test_table.get_stats()
+        #note:  equal roots and zero omega need no fallback.
+
+    # too many periods to tabulate
+    test_table = model.PolicyTable(.2, .2, model.TABLE_AXES + 2)
+    test_table.solve(np.array([.5]), np.array([.1]), np.array([1.]), np.ones((1, model.TABLE_AXES + 2)),
+                     np.ones((1, model.TABLE_AXES + 2)))
+    if not test_table.get_stats() == (1, 1):
+        print "TABLE3", test_table.get_stats()
+
+def loop_utility(person, nu, ns, wages, prices, omegau, omegas):
+    """
+    Individual.lifetime_utility from per-period consumption, the way it
+    was computed before UtilityPlan: rows are periods and columns are
+    fertility choices.
+    """
+    params = person.get_params()
+    age = person.get_age()
+    nu = np.asarray(nu, dtype=float)
+    ns = np.asarray(ns, dtype=float)
+    wage = np.asarray(wages, dtype=float).reshape(-1, 1)
+    price = np.asarray(prices, dtype=float).reshape(-1, 1)
+    shape = (len(wage), nu.size)
+    if age < params.age_middle:
+        # Too young to consume, so log(cm) is never defined.
+        return np.full(nu.shape, float("-inf"))
+    elif age < params.age_old:
+        working_time = 1 - params.tau_u * nu.reshape(1, -1) - params.tau_s * ns.reshape(1, -1)
+    elif age <= params.age_max:
+        working_time = np.ones((1, nu.size))
+    else:
+        assert False, "age error"
+
+    ratio = (params.beta / params.alpha)
+    c_m = ratio * (working_time * wage - price * params.ctilde) / (1 + ratio)
+    c_a = (wage * working_time - c_m) / price
+    feasible = (c_a > params.ctilde) & (c_m > 0)
+    if age < params.age_old:
+        gamma = params.tau_u * nu + params.tau_s * ns
+        feasible &= ~((wage * (1 - gamma.reshape(1, -1))) < ((c_m + price * c_a) - .001))
+        feasible &= (np.maximum(ns, nu) > 0).reshape(1, -1)
+    else:
+        feasible &= ~(wage < c_m + price * c_a - .001)
+    feasible = np.broadcast_to(feasible, shape)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        utils = params.alpha * np.log(c_m) + params.beta * np.log(c_a - params.ctilde)
+        if age < params.age_old:
+            kids = np.log(omegau * nu + omegas * ns).reshape(1, -1)
+            utils = utils + (1 - params.alpha - params.beta) * kids
+    utils = np.where(feasible, np.broadcast_to(utils, shape), float("-inf"))
+    # Reducing over the leading axis adds periods in order, like sum().
+    return utils.sum(axis=0).reshape(nu.shape)
+
+def check_plan():
+    """
+    :return: test_results
+    """
+    test_indiv = model.Individual("L", .2, .2,
+                                  .1, .1, .5,
+                                  1, 2, 2)
+    nu = [0, .5, 1, 2, 9]
+    ns = [0, .5, 0, 1, 0]
+    for age in [0, 1, 2]:
+        test_indiv.update_age(age)
+        test_plan = test_indiv.plan([1, 2], [1, 1.5], 2, 3)
+        batched = test_plan.values(nu, ns)
+        scalar = [test_plan.value(u, s) for u, s in zip(nu, ns)]
+        loop = loop_utility(test_indiv, nu, ns, [1, 2], [1, 1.5], 2, 3)
+        if not [round(x, 10) for x in batched] == [round(x, 10) for x in scalar] == [round(x, 10) for x in loop]:
+            print "PLAN1", age, batched, scalar, loop
+            #note:  -inf rounds to itself, so infeasible points must agree.
+
+    test_indiv.update_age(1)
+    test_plan = test_indiv.plan([1, 2], [1, 1.5], 2, 3)
+    first = test_plan.values(nu, ns)
+    test_plan.values([1, 1, 1, 1, 1], ns)
+    if not list(first) == list(test_plan.values(nu, ns)):
+        print "PLAN2", first
+        #note:  work buffers are reused, results are not.
 
 print "****************CHECK SMALL*****************"
 check_small_indiv()
@@ -210,3 +396,14 @@ check_get_consumption()
 print "***********CHECK MAXIMIZE *************"
 check_maximize()
 
+print "***********CHECK MAXIMIZE METHODS *************"
+check_maximize_methods()
+
+print "***********CHECK CACHE *************"
+check_cache()
+
+print "***********CHECK TABLE *************"
+check_table()
+
+print "***********CHECK PLAN *************"
+check_plan()
@@ -0,0 +1,208 @@
+"""
+Benchmarks for the household, firm and economy hot paths.
+
+    python bench.py --out bench.json
+    python bench.py --baseline bench.json --tolerance .25
+
+Timings are the best per-call time over several repeats. Allocations are
+the peak traced memory of one call, where tracemalloc is available
+(Python 3); otherwise peak_bytes is null and meta["allocations"] says
+they are unsupported. Cases that change what they run on get a fresh
+input from a setup function before every call, outside the timing.
+With --baseline, any case slower than the baseline by more than
+tolerance is listed and the exit status is 1.
+"""
+
+__author__ = 'Greg'
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+import numpy as np
+
+import model
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PERIODS = [1, 2, 20]
+HORIZONS = [100, 500, 2000]
+QUICK_HORIZONS = [100]
+# Child costs that keep every optimum inside NVECTOR, and omega pairs for
+# each branch of child_mix.
+TAU_U, TAU_S = .3, .39
+BRANCHES = {"low": (4., 1.), "high": (1., 4.), "both": (1., TAU_S / TAU_U)}
+
+
+def household_cases():
+    """
+    utility, get_consumption and maximize_n for each period count and branch.
+    """
+    person = model.Individual("low", tau_u=TAU_U, tau_s=TAU_S)
+    person.update_age(model.AGE_MIDDLE)
+    person.update_n(.5, .5)
+    for periods in PERIODS:
+        wages = [2. + .01 * i for i in range(periods)]
+        prices = [1. + .01 * i for i in range(periods)]
+        c_m, c_a = person.get_consumption(wages[0], prices[0])
+        yield ("household.get_consumption.p%d" % periods,
+               lambda wages=wages, prices=prices:
+               [person.get_consumption(w, p) for w, p in zip(wages, prices)])
+        yield ("household.utility.p%d" % periods,
+               lambda wages=wages, prices=prices, c_m=c_m, c_a=c_a:
+               [person.utility(w, p, c_m, c_a, 1., 1.) for w, p in zip(wages, prices)])
+        for branch, (omegau, omegas) in sorted(BRANCHES.items()):
+            for method in ["grid", "adaptive", "golden", "newton", "table"]:
+                yield ("household.maximize_n.%s.%s.p%d" % (method, branch, periods),
+                       lambda wages=wages, prices=prices, omegau=omegau, omegas=omegas, method=method:
+                       person.maximize_n(wages, prices, omegau, omegas, .75, method=method))
+
+
+def firm_cases(horizons):
+    """
+    Firm.update year by year against FirmPath.update, over long horizons.
+    """
+    for years in horizons:
+        inputs = [np.linspace(1., 2., years) for i in range(5)]
+        rows = list(zip(*[x.tolist() for x in inputs]))
+        firm = model.Firm(*rows[0])
+
+        def update_firms(firm=firm, rows=rows):
+            for row in rows:
+                firm.update(*row)
+        yield "firm.update.t%d" % years, update_firms
+        path = model.FirmPath(*inputs)
+        yield "firm.path_update.t%d" % years, lambda path=path, inputs=inputs: path.update(*inputs)
+
+
+def economy(years):
+    """
+    Economy over years periods with unit sizes and every firm built.
+    """
+    econ = model.Economy(0, years, omega_start=2, omega_end=3)
+    econ.add_all_indivs(.5, .5, -model.AGE_MAX, years)
+    econ.update_sizes(0, years)
+    econ.build_aggregate()
+    econ.build_firms(0, years, 1., 1.)
+    return econ
+
+
+def economy_cases(horizons):
+    """
+    build_aggregate, build_firms, get_omega for every cohort and one
+    big_loop iteration.
+    """
+    for years in horizons:
+        econ = economy(years)
+        year1, year2 = econ.get_decision_years()
+        yield "economy.build_aggregate.t%d" % years, econ.build_aggregate
+        yield ("economy.build_firms.t%d" % years,
+               lambda econ=econ, years=years: econ.build_firms(0, years, 1., 1.))
+        yield ("economy.get_omega.t%d" % years,
+               lambda econ=econ, year1=year1, year2=year2: [econ.get_omega(g) for g in range(year1, year2 + 1)])
+        yield ("economy.iteration.t%d" % years,
+               lambda econ: model.big_loop(econ, 1., 1., max_iter=1, tolw=.2),
+               lambda years=years: economy(years))
+
+
+def measure(function, repeat=3, budget=.2, setup=None):
+    """
+    Best seconds per call, and peak bytes traced during one call.
+    Calls are batched so that each repeat takes about budget seconds.
+    With setup, function is called on a new setup() every time, and
+    only the call is timed and traced.
+    """
+    if setup is None:
+        timer = timeit.Timer(function)
+        run = lambda number: timer.timeit(number)
+    else:
+        def run(number):
+            total = 0.
+            for i in range(number):
+                value = setup()
+                start = timeit.default_timer()
+                function(value)
+                total += timeit.default_timer() - start
+            return total
+    once = run(1)
+    number = max(1, int(budget / max(once, 1e-9)))
+    seconds = min(run(number) for i in range(repeat)) / number
+    peak = None
+    if tracemalloc is not None:
+        if setup is None:
+            tracemalloc.start()
+            function()
+        else:
+            value = setup()
+            tracemalloc.start()
+            function(value)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run(pattern="", quick=False, repeat=3):
+    """
+    Measure every case whose name contains pattern.
+    """
+    horizons = QUICK_HORIZONS if quick else HORIZONS
+    results = {}
+    for cases in (household_cases(), firm_cases(horizons), economy_cases(horizons)):
+        for case in cases:
+            name, function = case[:2]
+            if pattern in name:
+                seconds, peak = measure(function, repeat, setup=case[2] if len(case) > 2 else None)
+                results[name] = {"seconds": seconds, "peak_bytes": peak}
+    return {"meta": {"python": platform.python_version(), "numpy": np.__version__,
+                     "machine": platform.platform(),
+                     "allocations": "unsupported" if tracemalloc is None else "tracemalloc peak"},
+            "results": results}
+
+
+def compare(report, baseline, tolerance):
+    """
+    Return (name, ratio) for cases slower than baseline by more than tolerance.
+    """
+    slower = []
+    for name, result in sorted(report["results"].items()):
+        if name in baseline["results"]:
+            ratio = result["seconds"] / baseline["results"][name]["seconds"]
+            if ratio > 1 + tolerance:
+                slower.append((name, ratio))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark model hot paths.")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=.25, help="allowed slowdown, as a fraction")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="only the shortest horizon")
+    args = parser.parse_args(argv)
+
+    report = run(args.filter, args.quick, args.repeat)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as out:
+            out.write(text)
+    else:
+        sys.stdout.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as base:
+            slower = compare(report, json.load(base), args.tolerance)
+        for name, ratio in slower:
+            sys.stderr.write("SLOWER %s %.2fx\n" % (name, ratio))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
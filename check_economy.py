@@ -0,0 +1,630 @@
+__author__ = 'Greg'
+
+import itertools
+import os
+import tempfile
+import warnings
+
+import numpy as np
+
+import jacobian
+import model
+import profiling
+
+
+def check_omega():
+    """
+    Testing package for lifetime wage windows.
+    """
+    test_econ = model.Economy(0, 10, omega_start=1, omega_end=2)
+    for t in range(0, 5):
+        test_econ.add_firm(model.Firm(2, 3, 1, 4 + t, 2, .6), t)
+
+    # wages grow with Am, so omega is the sum over two firms
+    s1, u1, p1 = test_econ.get_firms()[1].get_prices()
+    s2, u2, p2 = test_econ.get_firms()[2].get_prices()
+    out_u, out_s = test_econ.get_omega(0)
+    if not (round(out_u, 10), round(out_s, 10)) == (round(u1 + u2, 10), round(s1 + s2, 10)):
+        print "OMEGA1", (out_u, out_s), (u1 + u2, s1 + s2)
+
+    # replacing a firm changes the windows that include it
+    test_econ.add_firm(model.Firm(1, 2, 3, 4, 5, .6), 2)
+    s2, u2, p2 = test_econ.get_firms()[2].get_prices()
+    out_u, out_s = test_econ.get_omega(1)
+    s3, u3, p3 = test_econ.get_firms()[3].get_prices()
+    if not (round(out_u, 10), round(out_s, 10)) == (round(u2 + u3, 10), round(s2 + s3, 10)):
+        print "OMEGA2", (out_u, out_s), (u2 + u3, s2 + s3)
+
+    # windows past the last firm are missing
+    try:
+        test_econ.get_omega(3)
+        print "OMEGA3"
+    except KeyError as missing:
+        if not missing.args[0] == 5:
+            print "OMEGA4", missing.args[0]
+
+    # updating a stored firm or path in place changes the windows too
+    old_firm = test_econ.get_firms()[2]
+    test_econ.add_firm(model.Firm(2, 3, 1, 9, 2, .6), 2)
+    old_firm.update(1, 1, 1, 1, 1)
+    before = test_econ.get_omega(0)
+    test_econ.get_firms()[1].update(2, 3, 1, 20, 2)
+    s1, u1, p1 = test_econ.get_firms()[1].get_prices()
+    s2, u2, p2 = test_econ.get_firms()[2].get_prices()
+    out_u, out_s = test_econ.get_omega(0)
+    if not (round(out_u, 10), round(out_s, 10)) == (round(u1 + u2, 10), round(s1 + s2, 10)) != before:
+        print "OMEGA5", (out_u, out_s), (u1 + u2, s1 + s2)
+    test_econ.add_firm_path(model.FirmPath(*[np.ones(5)] * 5, epsilon=.6))
+    before = test_econ.get_omega(0)
+    test_econ.get_firms().update_year(2, 2, 3, 1, 9, 2)
+    s1, u1, p1 = test_econ.get_firms()[1].get_prices()
+    s2, u2, p2 = test_econ.get_firms()[2].get_prices()
+    out_u, out_s = test_econ.get_omega(0)
+    if not (round(out_u, 10), round(out_s, 10)) == (round(u1 + u2, 10), round(s1 + s2, 10)) != before:
+        print "OMEGA6", (out_u, out_s), (u1 + u2, s1 + s2)
+
+def check_cohorts():
+    """
+    Testing package for the cohort table.
+    """
+    test_econ = model.Economy(0, 10)
+    test_econ.add_all_indivs(1, 2, 0, 3)
+    low_skill, high_skill = test_econ.get_indivs()[2]
+    if not (low_skill.get_type(), high_skill.get_type()) == ("low", "high"):
+        print "COHORT1", low_skill.get_type(), high_skill.get_type()
+    if not high_skill.get_n() == (2, 1):
+        print "COHORT2", high_skill.get_n()
+
+    # views write through to the table
+    high_skill.update_size(3)
+    high_skill.update_n(1, 0)
+    if not test_econ.get_indivs()[2][1].get_size() == 3:
+        print "COHORT3", test_econ.get_indivs()[2][1].get_size()
+    if not test_econ.get_indivs().get_n()[0][2, 1] == 1:
+        print "COHORT4", test_econ.get_indivs().get_n()
+
+    # individuals added one year at a time keep their own parameters
+    test_indiv = model.Individual("high", .4, .3, .15, .2, .1, 1, 2, 2, 5)
+    test_indiv.update_n(.5, .25)
+    test_econ.add_indivs((model.Individual("low"), test_indiv), 7)
+    stored = test_econ.get_indivs()[7][1]
+    if not (stored._alpha, stored._tau_s, stored.get_size(), stored.get_gamma()) == (.4, .2, 5, test_indiv.get_gamma()):
+        print "COHORT5", stored._alpha, stored._tau_s, stored.get_size(), stored.get_gamma()
+    if not sorted(test_econ.get_indivs()) == [0, 1, 2, 3, 7]:
+        print "COHORT6", sorted(test_econ.get_indivs())
+    if 5 in test_econ.get_indivs():
+        print "COHORT7"
+
+def check_aggregate():
+    """
+    Testing package for aggregate labor.
+    """
+    test_econ = model.Economy(2, 4)
+    test_econ.add_all_indivs(1, 2, 0, 4)
+    for year in range(0, 5):
+        low_skill, high_skill = test_econ.get_indivs()[year]
+        low_skill.update_size(year + 1)
+        high_skill.update_size(2 * (year + 1))
+
+    # ages 1 and 2 work, so year 3 counts cohorts born in 1 and 2.
+    test_econ.build_aggregate()
+    gamma = 2 * model.TAU_U + 1 * model.TAU_S
+    if not test_econ.get_pop(3) == (2 + 3, 4 + 6):
+        print "AGG1", test_econ.get_pop(3)
+    if not tuple(round(x, 10) for x in test_econ.get_supply(3)) == (round(5 * (1 - gamma), 10),
+                                                                   round(10 * (1 - gamma), 10)):
+        print "AGG2", test_econ.get_supply(3)
+
+    # the per-person loop agrees
+    window = [test_econ.get_pop(t) + test_econ.get_supply(t) for t in range(2, 5)]
+    test_econ.build_aggregate("loop")
+    loop = [test_econ.get_pop(t) + test_econ.get_supply(t) for t in range(2, 5)]
+    if not [[round(x, 10) for x in row] for row in window] == [[round(x, 10) for x in row] for row in loop]:
+        print "AGG3", window, loop
+
+def check_big_loop():
+    """
+    Testing package for the equilibrium driver.
+    """
+    test_econ = model.Economy(0, 20, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 20)
+    converged, history = model.big_loop(test_econ, 1., 1., "anderson", tolw=.2, tol=1e-8)
+    if not converged:
+        print "LOOP1", len(history), history[-1]
+
+    # at the fixed point, decisions reproduce the stored fertility
+    year1, year2 = test_econ.get_decision_years()
+    if not (year1, year2) == (-1, 17):
+        print "LOOP2", (year1, year2)
+    change = abs(test_econ.make_decisions(year1, year2, .2) - test_econ.get_fertility(year1, year2)).max()
+    if not change < 1e-8:
+        print "LOOP3", change
+
+    # the firm in each year is built from that year's aggregates
+    L, H = test_econ.get_pop(5)
+    L_tilde, H_tilde = test_econ.get_supply(5)
+    Hm, Lm, La = test_econ.get_firms()[5].get_labor()
+    if not (round(Hm, 10), round(Lm + La, 10)) == (round(H_tilde, 10), round(L_tilde, 10)):
+        print "LOOP4", (Hm, Lm, La), (L_tilde, H_tilde)
+
+    # table lookups agree with the exact solve
+    change = abs(test_econ.make_decisions(year1, year2, .2, "table") -
+                 test_econ.make_decisions(year1, year2, .2, "newton")).max()
+    if not change < model.TABLE_TOLERANCE:
+        print "LOOP5", change
+
+    # the other schemes converge with default damping, to a fixed point
+    for scheme in ["damped", "broyden"]:
+        scheme_econ = model.Economy(0, 20, omega_start=2, omega_end=3)
+        scheme_econ.add_all_indivs(.5, .5, -2, 20)
+        converged, history = model.big_loop(scheme_econ, 1., 1., scheme, tolw=.2, tol=1e-8, max_iter=200)
+        if not converged:
+            print "LOOP6", scheme, len(history), history[-1]
+        change = abs(scheme_econ.make_decisions(year1, year2, .2) - scheme_econ.get_fertility(year1, year2)).max()
+        if not change < 1e-8:
+            print "LOOP7", scheme, change
+
+def check_decisions():
+    """
+    Testing package for household decisions solved one by one.
+    """
+    params = model.Individual("low").get_params()._replace(tau_u=.3, tau_s=.39)
+    test_econ = model.Economy(0, 20, omega_start=2, omega_end=3, params=params)
+    test_econ.add_all_indivs(.5, .5, -2, 20)
+    model.big_loop(test_econ, 1., 1., tolw=.2, max_iter=3)
+    year1, year2 = test_econ.get_decision_years()
+
+    # with both child types in use, a cache that only reuses exact answers changes nothing, by method
+    for method in ["grid", "adaptive", "golden", "newton", "table"]:
+        serial = test_econ.make_decisions(year1, year2, .2, method)
+        cached = test_econ.make_decisions(year1, year2, .2, method, cache=model.HouseholdCache(tolerance=0))
+        if not (serial == cached).all():
+            print "DECIDE1", method, abs(serial - cached).max()
+
+    # so does a process pool, and so does a whole solve on one
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(2) as executor:
+        for method in ["grid", "adaptive", "golden", "newton", "table"]:
+            serial = test_econ.make_decisions(year1, year2, .2, method)
+            parallel = test_econ.make_decisions(year1, year2, .2, method, executor=executor, chunksize=5)
+            if not (serial == parallel).all():
+                print "DECIDE2", method, abs(serial - parallel).max()
+    histories = []
+    for workers in [None, 2]:
+        test_econ = model.Economy(0, 20, omega_start=2, omega_end=3, params=params)
+        test_econ.add_all_indivs(.5, .5, -2, 20)
+        histories.append((model.big_loop(test_econ, 1., 1., tolw=.2, workers=workers),
+                          test_econ.get_fertility(year1, year2)))
+    (serial, serial_n), (parallel, parallel_n) = histories
+    if not (serial == parallel and (serial_n == parallel_n).all()):
+        print "DECIDE3", serial[1][-1], parallel[1][-1]
+
+def check_profiler():
+    """
+    Testing package for per-phase timing.
+    """
+    original = model.Individual.maximize_n
+    test_econ = model.Economy(0, 10, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 10)
+    profiler = profiling.Profiler(trace=True)
+    with profiler:
+        converged, history = model.big_loop(test_econ, 1., 1., tolw=.2, max_iter=3, method="golden")
+        person = model.Individual("low", tau_u=.3, tau_s=.39)
+        person.update_age(model.AGE_MIDDLE)
+        person.maximize_n([2.], [1.], 4., 1., .75, method="grid")
+    if not (model.Individual.maximize_n == original and model._profiler is None):
+        print "PROF1"
+
+    # every iteration solves each deciding cohort once
+    year1, year2 = test_econ.get_decision_years()
+    rows = [row for row in profiler.get_report()
+            if row["phase"] == "Individual.maximize_n" and row["iteration"] is not None]
+    if not [(row["iteration"], row["calls"]) for row in rows] == [(i, 2 * (year2 - year1 + 1)) for i in range(3)]:
+        print "PROF2", rows
+
+    # the grid scores every point of NVECTOR, outside any iteration
+    grid = [row for row in profiler.get_report()
+            if row["phase"] == "UtilityPlan.values" and row["iteration"] is None]
+    if not [row["points"] for row in grid] == [len(model.NVECTOR)]:
+        print "PROF3", grid
+    if not 0 < grid[0]["infeasible"] < grid[0]["points"]:
+        print "PROF4", grid
+    if not len(profiler._events) == sum(row["calls"] for row in profiler.get_report()):
+        print "PROF5", len(profiler._events)
+
+    # later iterations update the stored firm path in place
+    rows = [row for row in profiler.get_report() if row["phase"] == "FirmPath.update_years"]
+    if not [(row["iteration"], row["calls"]) for row in rows] == [(1, 1), (2, 1)]:
+        print "PROF6", rows
+
+    # enabling twice wraps once, and still restores the originals
+    profiler.clear()
+    profiler.enable()
+    profiler.enable()
+    person.maximize_n([2.], [1.], 4., 1., .75, method="newton")
+    profiler.disable()
+    calls = profiler.get_totals()["Individual.maximize_n"]["calls"]
+    if not (calls == 1 and model.Individual.maximize_n == original and model._profiler is None):
+        print "PROF7", calls
+
+def check_checkpoint():
+    """
+    Testing package for saving and resuming economies.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "economy.npz")
+    full_econ = model.Economy(0, 20, omega_start=2, omega_end=3)
+    full_econ.add_all_indivs(.5, .5, -2, 20)
+    full = model.big_loop(full_econ, 1., 1., tolw=.2, tol=1e-8)
+
+    # stop after 6 iterations, then resume from the file
+    test_econ = model.Economy(0, 20, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 20)
+    model.big_loop(test_econ, 1., 1., tolw=.2, tol=1e-8, max_iter=6, checkpoint=path, checkpoint_every=4)
+    test_econ, solver = model.load_economy(path)
+    if not solver["iteration"] == 6:
+        print "CHECK1", solver["iteration"]
+    resumed = model.big_loop(test_econ, 1., 1., tolw=.2, tol=1e-8, resume=solver, checkpoint=path)
+    if not resumed == full:
+        print "CHECK2", resumed, full
+
+    # a loaded economy answers without solving
+    year1, year2 = full_econ.get_decision_years()
+    test_econ, solver = model.load_economy(path)
+    if not (test_econ.get_fertility(year1, year2) == full_econ.get_fertility(year1, year2)).all():
+        print "CHECK3"
+    if not [(test_econ.get_pop(t), test_econ.get_omega(t), test_econ.get_firms()[t].get_prices())
+            for t in range(0, 17)] == [(full_econ.get_pop(t), full_econ.get_omega(t),
+                                        full_econ.get_firms()[t].get_prices()) for t in range(0, 17)]:
+        print "CHECK4"
+    if not test_econ.get_indivs()[5][1].get_params() == full_econ.get_indivs()[5][1].get_params():
+        print "CHECK5", test_econ.get_indivs()[5][1].get_params()
+
+    # firm paths are saved as paths
+    full_econ.add_firm_path(model.FirmPath([1., 2.], [3., 4.], 1., 2., 1., .5, start_year=3))
+    full_econ.save(path)
+    test_econ, solver = model.load_economy(path)
+    if not (solver is None and test_econ.get_firms()[4].get_prices() == full_econ.get_firms()[4].get_prices()):
+        print "CHECK6", solver
+
+def check_simulate():
+    """
+    Testing package for streaming simulation.
+    """
+    fertility = [[.6, .45], [.5, .55]]
+    test_econ = model.Economy(0, 30, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 30)
+    test_econ.set_fertility(0, 30, np.array([fertility] * 31))
+    test_econ.update_sizes(0, 30)
+    test_econ.build_aggregate()
+    test_econ.build_firms(0, 30, 1., 1.)
+
+    # the stream matches the stored economy year by year
+    rows = list(test_econ.simulate(1., 1., fertility, 30))
+    if not [row["year"] for row in rows] == list(range(0, 31)):
+        print "SIM1", [row["year"] for row in rows]
+    for row in rows:
+        t = row["year"]
+        stream = [round(x, 10) for x in (row["L"], row["H"], row["L_tilde"], row["H_tilde"],
+                                         row["ws"], row["wu"], row["pa"])]
+        stored = [round(x, 10) for x in test_econ.get_pop(t) + test_econ.get_supply(t) +
+                  test_econ.get_firms()[t].get_prices()]
+        if not stream == stored:
+            print "SIM2", t, stream, stored
+
+    # without year2 the stream does not end
+    rows = itertools.islice(test_econ.simulate(1., 1., lambda year: fertility), 200)
+    if not [row["year"] for row in rows][-1] == 199:
+        print "SIM3"
+
+def check_refresh():
+    """
+    Testing package for incremental recomputation.
+    """
+    test_econ = model.Economy(0, 30, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 30)
+    full = model.big_loop(test_econ, 1., 1., tolw=.2, tol=1e-8)
+    test_econ = model.Economy(0, 30, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 30)
+    incremental = model.big_loop(test_econ, 1., 1., tolw=.2, tol=1e-8, dirty_tol=0)
+    if not incremental == full:
+        print "REFRESH1", incremental, full
+
+    # nothing changed, nothing recomputed
+    year1, year2 = test_econ.get_decision_years()
+    fertility = test_econ.get_fertility(year1, year2)
+    test_econ.set_fertility(year1, year2, fertility + 1e-9, 1e-8)
+    if not test_econ.refresh(1., 1.) == 0:
+        print "REFRESH2", test_econ.get_refreshed()
+
+    # a change in cohort 20 reaches its working years and every later firm
+    fertility[21 - year1] = [[.4, .3], [.2, .5]]
+    test_econ.set_fertility(year1, year2, fertility)
+    if not test_econ.refresh(1., 1.) == 30 - 22 + 1:
+        print "REFRESH3", test_econ.get_refreshed()
+    refreshed = [test_econ.get_pop(t) + test_econ.get_supply(t) + test_econ.get_firms()[t].get_prices()
+                 for t in range(0, 31)]
+    omega = [test_econ.get_omega(t) for t in range(0, 28)]
+    test_econ.update_sizes(0, 30)
+    test_econ.build_aggregate()
+    test_econ.build_firms(0, 30, 1., 1.)
+    if not np.allclose(refreshed, [test_econ.get_pop(t) + test_econ.get_supply(t) +
+                                   test_econ.get_firms()[t].get_prices() for t in range(0, 31)], rtol=1e-12):
+        print "REFRESH4"
+    rebuilt = [test_econ.get_omega(t) for t in range(0, 28)]
+    if not [(round(u, 10), round(s, 10)) for u, s in omega] == [(round(u, 10), round(s, 10)) for u, s in rebuilt]:
+        print "REFRESH5"
+
+    # skipped changes are stored before convergence is reported
+    dirty_econ = model.Economy(0, 30, omega_start=2, omega_end=3)
+    dirty_econ.add_all_indivs(.5, .5, -2, 30)
+    converged, history = model.big_loop(dirty_econ, 1., 1., tolw=.2, tol=1e-8, dirty_tol=1e-4)
+    dirty_econ.update_sizes(0, 30)
+    dirty_econ.build_aggregate()
+    dirty_econ.build_firms(0, 30, 1., 1.)
+    change = abs(dirty_econ.make_decisions(year1, year2, .2) - dirty_econ.get_fertility(year1, year2)).max()
+    if not (converged and change < 1e-8):
+        print "REFRESH6", converged, change
+
+    # some refreshes skip years, and the skip state survives a checkpoint
+    if not min(dirty_econ.get_refreshed()) < 31:
+        print "REFRESH7", dirty_econ.get_refreshed()
+    path = os.path.join(tempfile.mkdtemp(), "dirty.npz")
+    dirty_econ = model.Economy(0, 30, omega_start=2, omega_end=3)
+    dirty_econ.add_all_indivs(.5, .5, -2, 30)
+    model.big_loop(dirty_econ, 1., 1., tolw=.2, tol=1e-8, max_iter=4, checkpoint=path, dirty_tol=1e-4)
+    dirty_econ, solver = model.load_economy(path)
+    if not dirty_econ.refresh(1., 1.) == 0:
+        print "REFRESH8", dirty_econ.get_refreshed()
+    resumed = model.big_loop(dirty_econ, 1., 1., tolw=.2, tol=1e-8, resume=solver, dirty_tol=1e-4)
+    if not resumed[0]:
+        print "REFRESH9", resumed
+
+def check_sizes():
+    """
+    Testing package for population dynamics.
+    """
+    test_econ = model.Economy(0, 40, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 40)
+    rng = np.random.RandomState(0)
+    test_econ.set_fertility(-2, 40, rng.uniform(.3, .7, (43, 2, 2)))
+    test_econ.update_sizes(0, 40)
+    table = test_econ.get_indivs()
+    size, n = table.get_size(), table.get_fertility()
+    for t in range(0, 41):
+        i = table.get_rows(t, t).start
+        expected = [sum(size[i - 1][p] * n[i - 1][p][c] for p in range(2)) for c in range(2)]
+        if not [round(x / y, 10) for x, y in zip(size[i], expected)] == [1., 1.]:
+            print "SIZES1", t, size[i], expected
+
+    # fixed fertility grows each type by the matrix power
+    fixed = np.array([[.6, .3], [.2, .7]])
+    test_econ.set_fertility(-2, 40, np.tile(fixed, (43, 1, 1)))
+    test_econ.update_sizes(0, 40)
+    expected = np.dot(size[table.get_rows(-1, -1).start], np.linalg.matrix_power(fixed, 41))
+    if not np.allclose(size[table.get_rows(40, 40).start], expected, rtol=1e-12):
+        print "SIZES2", size[table.get_rows(40, 40).start], expected
+
+    # a later start leaves earlier cohorts alone
+    before = size[:table.get_rows(20, 20).start].copy()
+    test_econ.set_fertility(25, 40, np.tile(fixed.T, (16, 1, 1)))
+    test_econ.update_sizes(20, 40)
+    if not (size[:table.get_rows(20, 20).start] == before).all():
+        print "SIZES3"
+
+def check_firms():
+    """
+    Testing package for technology paths and firms.
+    """
+    test_econ = model.Economy(0, 30, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 30)
+    test_econ.update_sizes(0, 30)
+    test_econ.build_aggregate()
+    test_econ.build_firms(0, 30, 1., 2.)
+    firms = test_econ.get_firms()
+    if not (isinstance(firms, model.FirmPath) and list(firms) == list(range(0, 31))):
+        print "FIRMS1", type(firms)
+
+    # year by year growth gives the same levels and labor
+    Am, Aa = 1., 2.
+    for t in range(0, 31):
+        L, H = test_econ.get_pop(t)
+        L_tilde, H_tilde = test_econ.get_supply(t)
+        Lm = test_econ.labor_allocation(L_tilde, L + H, Aa)
+        if not firms[t].get_tech() + firms[t].get_labor() == (Am, Aa, H_tilde, Lm, L_tilde - Lm):
+            print "FIRMS2", t, firms[t].get_tech(), (Am, Aa)
+        growth_a, growth_m = test_econ.tech_growth(H_tilde / L_tilde)
+        Am, Aa = Am * (1 + growth_m), Aa * (1 + growth_a)
+
+    # a rebuild from year 10 keeps earlier firms and the path
+    before, last = firms[5].get_prices(), firms[30].get_tech()
+    test_econ.build_firms(10, 30, 3., 3.)
+    if not (test_econ.get_firms() is firms and firms[5].get_prices() == before and firms[10].get_tech() == (3., 3.)):
+        print "FIRMS3", firms[10].get_tech()
+
+    # firms outside the years join the path, unless they leave a gap
+    test_econ.add_firm_path(model.FirmPath(1., 1., 1., 1., 1., start_year=-1))
+    test_econ.build_firms(0, 30, 1., 2.)
+    if not (list(test_econ.get_firms()) == list(range(-1, 31)) and test_econ.get_firms()[-1].get_tech() == (1., 1.)):
+        print "FIRMS4", list(test_econ.get_firms())
+    test_econ = model.Economy(0, 30, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 30)
+    test_econ.update_sizes(0, 30)
+    test_econ.build_aggregate()
+    test_econ.add_firm(model.Firm(1., 1., 1., 1., 1.), -5)
+    test_econ.build_firms(0, 30, 1., 2.)
+    if not (sorted(test_econ.get_firms()) == [-5] + list(range(0, 31)) and
+            test_econ.get_firms()[30].get_tech() == last):
+        print "FIRMS5", sorted(test_econ.get_firms())
+
+    # an infeasible year raises before any arithmetic warning
+    supply = [test_econ.get_supply(t) for t in range(0, 31)]
+    supply[12] = (0., supply[12][1])
+    pop = [test_econ.get_pop(t) for t in range(0, 31)]
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            test_econ.make_firm_path(0, pop, supply, 1., 2.)
+            print "FIRMS6"
+        except ValueError as error:
+            if not (str(error).endswith(" 12") and caught == []):
+                print "FIRMS7", error, [str(warning.message) for warning in caught]
+
+def check_jacobian():
+    """
+    Testing package for linearized solves.
+    """
+    test_econ = model.Economy(0, 20, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 20)
+    model.big_loop(test_econ, 1., 1., tolw=.2, tol=1e-10)
+    year1, year2 = test_econ.get_decision_years()
+    solved = test_econ.get_fertility(year1, year2)
+    prices = [test_econ.get_firms()[t].get_prices() for t in range(0, 21)]
+    test_linear = jacobian.Linearization(test_econ, 1., 1., tolw=.2)
+    if not (prices == [test_econ.get_firms()[t].get_prices() for t in range(0, 21)] and
+            (test_econ.get_fertility(year1, year2) == solved).all()):
+        print "JAC1"
+        #note:  the economy is rebuilt at the solved fertility.
+
+    # the product of the blocks is the Jacobian of the whole map
+    x = solved.ravel()
+    fx = jacobian.evaluate(test_econ, x, 1., 1., .2)[2]
+    move = np.zeros(len(x))
+    move[6:8] = x[6:8] * 1e-6
+    change = (jacobian.evaluate(test_econ, x + move, 1., 1., .2)[2] - fx) / 1e-6
+    if not abs(change - test_linear.get_map_jacobian().dot(move / 1e-6)).max() < 1e-5:
+        print "JAC2", abs(change - test_linear.get_map_jacobian().dot(move / 1e-6)).max()
+
+    # a small shock to tau_s, linearized and solved
+    params = model.Individual("low").get_params()._replace(tau_s=model.TAU_S * 1.001)
+    shocked = model.Economy(0, 20, omega_start=2, omega_end=3, params=params)
+    shocked.add_all_indivs(.5, .5, -2, 20)
+    linear = test_linear.respond(shocked)
+    shocked.set_fertility(year1, year2, solved)
+    model.big_loop(shocked, 1., 1., tolw=.2, tol=1e-10)
+    exact = shocked.get_fertility(year1, year2)
+    if not abs(linear["fertility"] - exact).max() < 1e-3 * abs(exact - solved).max():
+        print "JAC3", abs(linear["fertility"] - exact).max(), abs(exact - solved).max()
+    exact_prices = np.array([shocked.get_firms()[t].get_prices() for t in range(0, 21)])
+    if not abs(linear["prices"] / exact_prices - 1).max() < 1e-6:
+        print "JAC4", abs(linear["prices"] / exact_prices - 1).max()
+
+    # Newton steps with the stored Jacobian
+    shocked.set_fertility(year1, year2, solved)
+    converged, history = jacobian.newton_solve(shocked, 1., 1., test_linear, tol=1e-10, tolw=.2)
+    if not (converged and len(history) <= 4 and abs(shocked.get_fertility(year1, year2) - exact).max() < 1e-9):
+        print "JAC5", converged, history
+
+def check_types():
+    """
+    Testing package for economies with more skill types.
+    """
+    params = model.Individual("low").get_params()
+    types = [model.SkillType("low", "low", params.tau_u), model.SkillType("high", "high", params.tau_s),
+             model.SkillType("high2", "high", params.tau_s)]
+    two_econ = model.Economy(0, 20, omega_start=2, omega_end=3)
+    two_econ.add_all_indivs(.5, .5, -2, 20)
+    test_econ = model.Economy(0, 20, omega_start=2, omega_end=3, types=types)
+    test_econ.add_all_indivs(.25, .5, -2, 20)
+    test_econ.get_indivs().get_size()[:, 1:] = .5
+
+    # splitting the high type in two halves changes nothing
+    year1, year2 = two_econ.get_decision_years()
+    two = two_econ.get_fertility(year1, year2) * np.linspace(.8, 1.2, 4).reshape(2, 2)
+    split = np.concatenate((two, two[..., 1:]), axis=-1) / [1, 2, 2]
+    split = np.concatenate((split, split[:, 1:]), axis=1)
+    for econ, fertility in ((two_econ, two), (test_econ, split)):
+        econ.set_fertility(year1, year2, fertility)
+        econ.update_sizes(0, 20)
+        econ.build_aggregate()
+        econ.build_firms(0, 20, 1., 1.)
+    two_pop = [[round(x, 10) for x in two_econ.get_pop(t) + two_econ.get_supply(t)] for t in range(0, 21)]
+    test_pop = [[round(x, 10) for x in test_econ.get_pop(t) + test_econ.get_supply(t)] for t in range(0, 21)]
+    if not two_pop == test_pop:
+        print "TYPES1", two_pop[-1], test_pop[-1]
+    two = two_econ.make_decisions(year1, year2, .2)
+    split = test_econ.make_decisions(year1, year2, .2)
+    merged = np.concatenate((split[..., :1], split[..., 1:].sum(axis=-1)[..., np.newaxis]), axis=-1)
+    if not (abs(merged[:, :2] - two).max() < 1e-10 and (split[:, 1] == split[:, 2]).all()):
+        print "TYPES2", abs(merged[:, :2] - two).max()
+
+    # one by one solves need the default types, and agree with the batch
+    try:
+        test_econ.make_decisions(year1, year2, .2, cache=model.HouseholdCache())
+        print "TYPES3"
+    except ValueError:
+        pass
+    if not (two_econ.make_decisions(year1, year2, .2, cache=model.HouseholdCache()) == two).all():
+        print "TYPES4"
+
+    # three types with the most omega per unit of child time in slot 1
+    types = [model.SkillType("low", "low", .3), model.SkillType("low2", "low", .15),
+             model.SkillType("high", "high", .195)]
+    test_econ = model.Economy(0, 20, omega_start=2, omega_end=3, types=types)
+    test_econ.add_all_indivs(.5, .5, -2, 20)
+    test_econ.update_sizes(0, 20)
+    test_econ.build_aggregate()
+    test_econ.build_firms(0, 20, 1., 1.)
+    test_econ.get_omega = lambda year: (1., 1.25)
+    chosen = test_econ.make_decisions(year1, year2) > 0
+    if not (chosen[..., 1].all() and not chosen[..., 0].any() and not chosen[..., 2].any()):
+        print "TYPES5", chosen.sum(axis=(0, 1))
+    # omega_high tau_low2 - omega_low2 tau_high, relative to low, is .025
+    chosen = test_econ.make_decisions(year1, year2, .03) > 0
+    if not (chosen[..., 1:].all() and not chosen[..., 0].any()):
+        print "TYPES6", chosen.sum(axis=(0, 1))
+
+    # a three-type cohort round trips through add_indivs and get_indivs
+    test_econ.set_fertility(5, 5, np.arange(9.).reshape(1, 3, 3) / 10)
+    cohort = test_econ.get_indivs()[5]
+    test_econ.add_indivs(cohort, 40)
+    stored = test_econ.get_indivs()[40]
+    if not ([(p.get_type(), p.get_children(), p.get_size()) for p in stored] ==
+            [(p.get_type(), p.get_children(), p.get_size()) for p in cohort] and
+            stored[2].get_children() == (.6, .7, .8)):
+        print "TYPES7", [p.get_children() for p in stored]
+    if not (test_econ.get_indivs().get_tau()[-1] == [.3, .15, .195]).all():
+        print "TYPES8", test_econ.get_indivs().get_tau()[-1]
+    try:
+        test_econ.add_indivs([model.Individual("low")] * 3, 41)
+        print "TYPES9"
+    except AssertionError:
+        pass
+
+print "*****************CHECK OMEGA*********************"
+check_omega()
+
+print "*****************CHECK COHORTS*******************"
+check_cohorts()
+
+print "*****************CHECK AGGREGATE*****************"
+check_aggregate()
+
+print "*****************CHECK BIG LOOP******************"
+check_big_loop()
+
+print "*****************CHECK DECISIONS*****************"
+check_decisions()
+
+print "*****************CHECK PROFILER******************"
+check_profiler()
+
+print "*****************CHECK CHECKPOINT****************"
+check_checkpoint()
+
+print "*****************CHECK SIMULATE******************"
+check_simulate()
+
+print "*****************CHECK REFRESH*******************"
+check_refresh()
+
+print "*****************CHECK SIZES*********************"
+check_sizes()
+
+print "*****************CHECK FIRMS*********************"
+check_firms()
+
+print "*****************CHECK JACOBIAN******************"
+check_jacobian()
+
+print "*****************CHECK TYPES*********************"
+check_types()
@@ -50,7 +50,73 @@ def check_prod():
     if not new_firm.get_output() == (t_Yt, t_Ym, t_Ya):
         print "PROD10"
 
+def check_prod_path():
+    """
+    Testing package for firm paths.
+    """
+
+    # Two years, matching the firms in check_prod
+    test_path = model.FirmPath([2, 1], [3, 2], [1, 3], [4, 4], [2, 5], .6, 10)
+    if not (len(test_path), list(test_path)) == (2, [10, 11]):
+        print "PATH1", len(test_path), list(test_path)
+    if not test_path.get_labor(11) == (1, 2, 3):
+        print "PATH2", test_path.get_labor(11)
+
+    first_firm = model.Firm(2, 3, 1, 4, 2, .6)
+    second_firm = model.Firm(1, 2, 3, 4, 5, .6)
+    rounded = lambda values: [round(x, 10) for x in values]
+    for year, firm in [(10, first_firm), (11, second_firm)]:
+        if not rounded(test_path[year].get_prices()) == rounded(firm.get_prices()):
+            print "PATH3", year, test_path[year].get_prices(), firm.get_prices()
+        if not rounded(test_path[year].get_output()) == rounded(firm.get_output()):
+            print "PATH4", year, test_path[year].get_output(), firm.get_output()
+
+    # Update a single year from a firm
+    test_path[10] = second_firm
+    if not rounded(test_path.get_prices(10)) == rounded(second_firm.get_prices()):
+        print "PATH5", test_path.get_prices(10)
+    if not rounded(test_path[10].copy().get_output()) == rounded(second_firm.get_output()):
+        print "PATH6", test_path[10].copy().get_output()
+    if 12 in test_path:
+        print "PATH7"
+
+def check_initial():
+    """
+    Testing package for calibration of initial technology and prices.
+    """
+
+    # Two targets, with epsilon from labor_allocation
+    econ = model.Economy(0, 10)
+    rounded = lambda values: [round(x, 8) for x in values]
+    epsilon, Am, Aa, ws, wu, pa = model.initial([2, 1], [1, 2], [3, 3], [4, 10], [6, 15], [5, 4])
+    if not rounded(Aa) == [2, 5]:
+        print "INIT1", Aa
+    if not (rounded(econ.labor_allocation([4, 5], [4, 10], Aa, epsilon=epsilon)) == [1, 2] and
+            rounded(epsilon) == rounded([1 - 1 / 2.8, 1 - 1 / 1.4])):
+        print "INIT2", epsilon
+    for i in range(2):
+        firm = model.Firm([2, 1][i], [1, 2][i], [3, 3][i], Am[i], Aa[i], epsilon[i])
+        if not rounded(firm.get_output()[1:]) == rounded([[5, 4][i], [6, 15][i]]):
+            print "INIT3", i, firm.get_output()
+        if not rounded(firm.get_prices()) == rounded((ws[i], wu[i], pa[i])):
+            print "INIT4", i, firm.get_prices(), ws[i], wu[i], pa[i]
+
+    # Scalars give arrays of one target, and infeasible targets raise
+    if not len(model.initial(2, 1, 3, 4, 6, 5)[0]) == 1:
+        print "INIT5"
+    try:
+        model.initial([2, 1], [1, 2], [3, 3], [4, 100], [6, 15], [5, 4])
+        print "INIT6"
+    except ValueError:
+        pass
+
 print "*****************CHECK PRODUCTION*********************"
 check_prod()
 
+print "*****************CHECK PRODUCTION PATH****************"
+check_prod_path()
+
+
 
+print "*****************CHECK INITIAL************************"
+check_initial()
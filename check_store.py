@@ -0,0 +1,73 @@
+__author__ = 'Greg'
+
+import tempfile
+
+import numpy as np
+
+import model
+import store
+
+
+def economy():
+    test_econ = model.Economy(0, 20, omega_start=2, omega_end=3)
+    test_econ.add_all_indivs(.5, .5, -2, 20)
+    return test_econ
+
+
+def check_store():
+    """
+    Testing package for the result store.
+    """
+    results = store.ResultStore(tempfile.mkdtemp())
+    key = results.key(economy(), 1., 1., tolw=.2)
+    if not (key == results.key(economy(), 1., 1., tolw=.2, report=None) and
+            key != results.key(economy(), 1., 1., tolw=.3) and key != results.key(economy(), 1., 2., tolw=.2)):
+        print "STORE1", key
+        #note:  options that do not change the answer are not keyed.
+
+    test_econ = economy()
+    run = results.solve(test_econ, 1., 1., tolw=.2)
+    if not (run.get_key() == key and key in results and run.get_meta()["converged"]):
+        print "STORE2", run.get_key(), run.get_meta()
+
+    # a repeat solve loads the stored run
+    again = results.solve(economy(), 1., 1., tolw=.2)
+    if not (again.get_key() == key and results.keys() == [key]):
+        print "STORE3", results.keys()
+    prices = again.column("prices")
+    if not (isinstance(prices, np.memmap) and
+            prices[5].tolist() == list(test_econ.get_firms()[5].get_prices())):
+        print "STORE4", prices[5]
+
+    loaded = again.load_economy()
+    year1, year2 = test_econ.get_decision_years()
+    if not ((loaded.get_fertility(year1, year2) == test_econ.get_fertility(year1, year2)).all() and
+            [loaded.get_pop(t) for t in range(0, 21)] == [test_econ.get_pop(t) for t in range(0, 21)]):
+        print "STORE5"
+
+    results.solve(economy(), 1., 1.1, tolw=.2)
+    if not len(list(results.runs())) == 2:
+        print "STORE6", results.keys()
+
+    # a cache is keyed by its tolerance, so repeat solves with one are found
+    first = results.solve(economy(), 1., 1., tolw=.2, cache=model.HouseholdCache())
+    again = results.solve(economy(), 1., 1., tolw=.2, cache=model.HouseholdCache())
+    if not (first.get_key() == again.get_key() and len(results.keys()) == 3 and
+            first.get_key() != results.key(economy(), 1., 1., tolw=.2, cache=model.HouseholdCache(tolerance=0))):
+        print "STORE7", results.keys()
+
+    # a warm cache that rounds depends on earlier solves, so it has no key
+    shared = model.HouseholdCache()
+    results.solve(economy(), 1.1, 1., tolw=.2, cache=shared)
+    try:
+        results.solve(economy(), 1.2, 1., tolw=.2, cache=shared)
+        print "STORE8", results.keys()
+    except ValueError:
+        pass
+    exact = model.HouseholdCache(tolerance=0)
+    results.solve(economy(), 1.1, 1., tolw=.2, cache=exact)
+    if not results.solve(economy(), 1.2, 1., tolw=.2, cache=exact).get_key() in results:
+        print "STORE9"
+
+print "*****************CHECK STORE*********************"
+check_store()
@@ -0,0 +1,54 @@
+__author__ = 'Greg'
+
+import csv
+import os
+import tempfile
+
+import numpy as np
+
+import sweep
+
+
+def check_sweep():
+    """
+    Testing package for scenario sweeps.
+    """
+    grid = {"TAU_S": [.19, .195], "EPSILON": [.58]}
+    scenarios = sweep.scenario_grid(grid)
+    if not scenarios == [{"EPSILON": .58, "TAU_S": .19}, {"EPSILON": .58, "TAU_S": .195}]:
+        print "SWEEP1", scenarios
+
+    path = os.path.join(tempfile.mkdtemp(), "sweep.csv")
+    rows = sweep.run_sweep(grid, path=path)
+    if not [row["converged"] for row in rows] == [True, True]:
+        print "SWEEP2", [(row["converged"], row["error"]) for row in rows]
+    if not [row["warm_start"] for row in rows] == ["", 0]:
+        print "SWEEP3", [row["warm_start"] for row in rows]
+
+    # the warm start should beat solving from scratch
+    cold, fertility = sweep.solve_scenario(scenarios[1])
+    if not rows[1]["iterations"] < cold["iterations"]:
+        print "SWEEP4", rows[1]["iterations"], cold["iterations"]
+    if not rows[1]["residual"] < 1e-6:
+        print "SWEEP5", rows[1]["residual"]
+        #note:  ratios inside tolw are all fixed points, so warm and cold answers can differ.
+
+    with open(path) as table:
+        written = list(csv.DictReader(table))
+    if not (len(written), float(written[1]["TAU_S"])) == (2, .195):
+        print "SWEEP6", written
+
+    # a warm start that runs out of iterations is solved again from the guesses
+    setup = dict(sweep.SETUP, solver={"tolw": .2, "max_iter": cold["iterations"]})
+    row, fertility = sweep.solve_scenario(scenarios[1], setup, np.full(fertility.shape, .2))
+    if not (row["converged"], row.get("warm_start")) == (True, ""):
+        print "SWEEP7", row
+
+    # integer grids are measured in fractions of their range
+    grid = {"B": [1, 4], "EPSILON": [0, 3]}
+    scenarios = sweep.scenario_grid(grid)
+    if not sweep.nearest({"B": 2, "EPSILON": 0}, {1: None, 2: None}, scenarios, sweep.grid_scale(grid)) == 2:
+        print "SWEEP8"
+
+print "*****************CHECK SWEEP*********************"
+check_sweep()
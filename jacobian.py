@@ -0,0 +1,196 @@
+"""
+Sequence-space Jacobians of the equilibrium around a solved economy.
+
+    linear = jacobian.Linearization(economy, Am, Aa, tolw=.2)
+    path = linear.respond(shocked, Am, Aa)
+    converged, history = jacobian.newton_solve(shocked, Am, Aa, linear, tolw=.2)
+
+An equilibrium is a fixed point of three blocks over the whole horizon:
+fertility of the decision cohorts gives aggregates (update_sizes and
+build_aggregate), aggregates and technology give prices
+(make_firm_path), and prices give fertility (make_decisions). Each block
+is differentiated once by forward differences around the solved path,
+and the Jacobian of the fixed-point map is their product.
+
+A shock is an economy of the same horizon with other parameters, types
+or starting technology. Its direct effect is one pass of its blocks at
+the old fertility; the linearized transition then takes one solve with
+the stored Jacobians.
+
+Households also keep the mix of child types they chose before. Where
+types tie, any mix is an equilibrium, so the map is not differentiated
+in the mix: each cohort keeps its solved child types and mix, and the
+Jacobian holds for changes that scale them.
+"""
+
+__author__ = 'Greg'
+
+import numpy as np
+
+import model
+
+# Forward difference step, relative to the size of each input.
+STEP = 1e-6
+
+
+def aggregate_block(economy, x):
+    """
+    Aggregates by year, (L, H, L_tilde, H_tilde) for start to end time,
+    with fertility x of the decision cohorts.
+    """
+    start, end = economy.get_horizon()
+    year1, year2 = economy.get_decision_years()
+    shape = economy.get_fertility(year1, year2).shape
+    economy.set_fertility(year1, year2, np.reshape(x, shape))
+    economy.update_sizes(start, end)
+    economy.build_aggregate()
+    return np.array([economy.get_pop(t) + economy.get_supply(t) for t in range(start, end + 1)])
+
+
+def price_block(economy, aggregates, Am, Aa):
+    """
+    FirmPath over the horizon for aggregates from aggregate_block.
+    """
+    start, end = economy.get_horizon()
+    return economy.make_firm_path(start, aggregates[:, :2], aggregates[:, 2:], Am, Aa)
+
+
+def household_block(economy, path, tolw=model.TOLW, method="newton"):
+    """
+    Flat fertility of the decision cohorts facing the prices of path.
+    """
+    year1, year2 = economy.get_decision_years()
+    economy.add_firm_path(path)
+    return economy.make_decisions(year1, year2, tolw, method).ravel()
+
+
+def evaluate(economy, x, Am, Aa, tolw=model.TOLW, method="newton"):
+    """
+    One pass of the three blocks, as in an iteration of big_loop.
+    :return: aggregates, price path (ws, wu, pa) by year and new fertility.
+    """
+    aggregates = aggregate_block(economy, x)
+    path = price_block(economy, aggregates, Am, Aa)
+    fertility = household_block(economy, path, tolw, method)
+    return aggregates, np.column_stack(path.get_price_path()), fertility
+
+
+def _difference(function, point, step=STEP):
+    """
+    Forward difference Jacobian of function at a flat point.
+    """
+    base = function(point)
+    columns = []
+    for i in range(len(point)):
+        h = step * max(abs(point[i]), 1.)
+        moved = point.copy()
+        moved[i] += h
+        columns.append((function(moved) - base) / h)
+    return np.column_stack(columns).reshape(len(base), len(point))
+
+
+class Linearization:
+    """
+    Block Jacobians of an economy around its current fertility, which
+    should be an equilibrium for Am and Aa. The economy is left as it was
+    found, rebuilt at that fertility.
+    """
+
+    def __init__(self, economy, Am, Aa, tolw=model.TOLW, method="newton", step=STEP):
+        self._Am = Am
+        self._Aa = Aa
+        self._tolw = tolw
+        self._method = method
+        year1, year2 = economy.get_decision_years()
+        self._years = economy.get_horizon(), (year1, year2)
+        self._x = economy.get_fertility(year1, year2).ravel()
+        self._aggregates, self._prices, fertility = evaluate(economy, self._x, Am, Aa, tolw, method)
+        self._residual = fertility - self._x
+        path = economy.get_firms()
+
+        def households(prices):
+            moved = path.copy()
+            moved.set_prices(*prices.reshape(-1, 3).T)
+            return household_block(economy, moved, tolw, method)
+
+        def firms(aggregates):
+            return np.column_stack(price_block(economy, aggregates.reshape(-1, 4), Am, Aa).get_price_path()).ravel()
+
+        self._household = _difference(households, self._prices.ravel(), step)
+        self._price = _difference(firms, self._aggregates.ravel(), step)
+        self._aggregate = _difference(lambda x: aggregate_block(economy, x).ravel(), self._x, step)
+        self._downstream = self._price.dot(self._aggregate)
+        self._map = self._household.dot(self._downstream)
+        self._inverse = np.linalg.inv(np.eye(len(self._x)) - self._map)
+        evaluate(economy, self._x, Am, Aa, tolw, method)
+
+    def get_jacobians(self):
+        """
+        Return the Jacobians of fertility by prices, of prices by
+        aggregates and of aggregates by fertility. Prices are flattened
+        as (ws, wu, pa) by year and aggregates as (L, H, L_tilde, H_tilde).
+        """
+        return {"household": self._household, "price": self._price, "aggregate": self._aggregate}
+
+    def get_map_jacobian(self):
+        """
+        Return the Jacobian of new fertility by fertility, for changes
+        that keep each household's mix of child types.
+        """
+        return self._map
+
+    def get_residual(self):
+        """
+        Return the fixed-point residual at the linearization point.
+        """
+        return self._residual
+
+    def step(self, x, fx):
+        """
+        Newton step on F(x) - x = 0 with the stored Jacobian.
+        """
+        return x + self._inverse.dot(fx - x)
+
+    def respond(self, economy, Am=None, Aa=None):
+        """
+        Linearized equilibrium of economy, a shocked copy of the solved
+        one, starting from Am and Aa (by default the solved ones). Its
+        fertility is replaced by the solved fertility and rebuilt.
+        :return: dictionary of fertility (shaped as get_fertility),
+                 aggregates and prices by year.
+        """
+        if Am is None:
+            Am = self._Am
+        if Aa is None:
+            Aa = self._Aa
+        year1, year2 = economy.get_decision_years()
+        if (economy.get_horizon(), (year1, year2)) != self._years:
+            raise ValueError("Shocked economy does not match the linearization")
+        shape = economy.get_fertility(year1, year2).shape
+        aggregates, prices, fertility = evaluate(economy, self._x, Am, Aa, self._tolw, self._method)
+        dx = self._inverse.dot(fertility - self._x - self._residual)
+        return {"fertility": (self._x + dx).reshape(shape),
+                "aggregates": aggregates + self._aggregate.dot(dx).reshape(aggregates.shape),
+                "prices": prices + self._downstream.dot(dx).reshape(prices.shape)}
+
+
+def newton_solve(economy, Am, Aa, linear, tol=1e-6, max_iter=20, tolw=model.TOLW, method="newton", report=None):
+    """
+    Solve for equilibrium fertility as big_loop does, with each step a
+    Newton step using the Jacobian of linear. Starts from the economy's
+    fertility; negative guesses are set to zero.
+    :return: converged flag and list of residuals.
+    """
+    year1, year2 = economy.get_decision_years()
+    x = economy.get_fertility(year1, year2).ravel()
+    history = []
+    for iteration in range(max_iter):
+        fx = evaluate(economy, x, Am, Aa, tolw, method)[2]
+        residual = float(np.abs(fx - x).max())
+        history.append(residual)
+        if report is not None:
+            report(iteration, residual)
+        if residual < tol:
+            return True, history
+        x = np.maximum(linear.step(x, fx), 0)
+    return False, history
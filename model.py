@@ -1,7 +1,12 @@
 __user__ = 'Greg'
 __project__ = 'Checking'
 
+import collections
+import itertools
 import math
+import os
+
+import numpy as np
 
 # Constants
 ALPHA = .3
@@ -14,18 +19,68 @@ TOLW = .02
 AGE_MIDDLE = 1
 AGE_OLD = 2
 AGE_MAX = 2
+AGE_BIRTH = AGE_MIDDLE
+# Technology growth (placeholders until calibrated)
+B = .02
+DELTA = .5
+ETA_M = 1
+ETA_A = .5
+# Years ahead whose wages make up omega
+OMEGA_START = 20
+OMEGA_END = 40
 NVECTOR = [n / 500.0 for n in range(0, 1200)]
+XTOL = 1e-10
+# Points per pass of the adaptive grid
+ADAPTIVE_POINTS = 25
+GOLDEN = (math.sqrt(5) - 1) / 2
+# Household solves per task sent to a process pool
+CHUNKSIZE = 32
+# Default bound and input rounding of HouseholdCache
+CACHE_SIZE = 100000
+CACHE_TOLERANCE = 1e-12
+# Total points, most axes and error bound of a PolicyTable
+TABLE_SIZE = 2 ** 16
+TABLE_AXES = 2
+TABLE_TOLERANCE = 1e-6
+# Set by profiling.Profiler while enabled.
+_profiler = None
+# PolicyTable by alpha, beta and number of working periods.
+_policy_tables = {}
+
+# Preference and life-cycle parameters shared by a group of people.
+HouseholdParams = collections.namedtuple(
+    "HouseholdParams",
+    ["alpha", "beta", "tau_u", "tau_s", "ctilde", "age_middle", "age_old", "age_max"])
+
+
+# A skill type: its label, the labor it supplies ("low" or "high") and
+# the time cost of raising a child of this type.
+SkillType = collections.namedtuple("SkillType", ["label", "labor", "tau"])
+LABOR = ("low", "high")
+
+
+def _make_params(values):
+    """
+    HouseholdParams from a row of floats, with integer ages.
+    """
+    return HouseholdParams(*[int(value) if name.startswith("age") else float(value)
+                             for name, value in zip(HouseholdParams._fields, values)])
 
 
-class Firm:
+class Firm(object):
     """
     Describes behavior of aggregate firm.
+    Economies storing the firm are told when update changes it.
     """
 
+    __slots__ = ("_epsilon", "_Hm", "_Lm", "_La", "_Aa", "_Am", "_Ya", "_Ym", "_wu", "_ws", "_pa", "_Yt",
+                 "_watchers")
+
     def __init__(self, Hm, Lm, La, Am, Aa, epsilon=EPSILON):
         """
         Initialize firm.
         """
+        self._watchers = []
         self._epsilon = epsilon
         self._Hm = Hm
         self._Lm = Lm
@@ -54,6 +109,20 @@ class Firm:
         self._ws = self._epsilon * Am * (Hm ** (self._epsilon - 1)) * (Lm ** (1 - self._epsilon))
         self._pa = self._wu / self._Aa
         self._Yt = self._Ym + self._pa * self._Ya
+        for economy, year in self._watchers:
+            economy.invalidate_firms(year)
+
+    def watch(self, economy, year):
+        """
+        Call economy.invalidate_firms(year) whenever the firm is updated.
+        """
+        self._watchers.append((economy, year))
+
+    def unwatch(self, economy, year):
+        self._watchers.remove((economy, year))
+
+    def get_epsilon(self):
+        return self._epsilon
 
     def get_labor(self):
         """
@@ -81,44 +150,270 @@ class Firm:
 
     def copy(self):
         """
-        Make a copy of the firm.
+        Make a copy of the firm, reusing its prices and output.
+        The copy is not watched.
         """
-        new_firm = Firm(self._Hm, self._Lm, self._La, self._Am, self._Aa, self._epsilon)
+        new_firm = Firm.__new__(Firm)
+        for name in Firm.__slots__:
+            setattr(new_firm, name, getattr(self, name))
+        new_firm._watchers = []
         return new_firm
 
 
+class FirmView:
+    """
+    One year of a FirmPath, with the getters of Firm.
+    """
+
+    def __init__(self, path, year):
+        self._path = path
+        self._year = year
+
+    def get_epsilon(self):
+        return self._path.get_epsilon()
+
+    def get_labor(self):
+        return self._path.get_labor(self._year)
+
+    def get_tech(self):
+        return self._path.get_tech(self._year)
+
+    def get_prices(self):
+        return self._path.get_prices(self._year)
+
+    def get_output(self):
+        return self._path.get_output(self._year)
+
+    def watch(self, economy, year):
+        self._path.watch(economy)
+
+    def unwatch(self, economy, year):
+        self._path.unwatch(economy)
 
+    def copy(self):
+        """
+        Make a stand-alone Firm for this year.
+        """
+        Hm, Lm, La = self.get_labor()
+        Am, Aa = self.get_tech()
+        return Firm(Hm, Lm, La, Am, Aa, self._path.get_epsilon())
 
-class Individual:
+
+class FirmPath:
+    """
+    Aggregate firm for every year of a horizon, held as arrays.
+    Indexing by year gives a FirmView, so a FirmPath can stand in for
+    a dictionary of Firm objects. Economies storing the path are told
+    the first year changed by every update.
+    """
+
+    def __init__(self, Hm, Lm, La, Am, Aa, epsilon=EPSILON, start_year=0):
+        """
+        Initialize firm path. Inputs are arrays over years from start_year.
+        """
+        self._watchers = []
+        self._epsilon = epsilon
+        self._start_year = start_year
+        self.update(Hm, Lm, La, Am, Aa)
+
+    def update(self, Hm, Lm, La, Am, Aa):
+        """
+        Update production in every year based on new inputs.
+        """
+        inputs = np.broadcast_arrays(*[np.array(x, dtype=float) for x in (Hm, Lm, La, Am, Aa)])
+        self._Hm, self._Lm, self._La, self._Am, self._Aa = [np.array(x, ndmin=1) for x in inputs]
+        size = len(self._Hm)
+        self._Ya, self._Ym, self._Yt = np.empty(size), np.empty(size), np.empty(size)
+        self._ws, self._wu, self._pa = np.empty(size), np.empty(size), np.empty(size)
+        self._compute(slice(None))
+
+    def update_year(self, year, Hm, Lm, La, Am, Aa):
+        """
+        Update production in a single year.
+        """
+        i = self._index(year)
+        self._Hm[i], self._Lm[i], self._La[i], self._Am[i], self._Aa[i] = Hm, Lm, La, Am, Aa
+        self._compute(slice(i, i + 1))
+
+    def update_years(self, year1, Hm, Lm, La, Am, Aa):
+        """
+        Update production in consecutive years from year1, one per input.
+        """
+        inputs = np.broadcast_arrays(*[np.array(x, dtype=float, ndmin=1) for x in (Hm, Lm, La, Am, Aa)])
+        index = slice(self._index(year1), self._index(year1 + len(inputs[0]) - 1) + 1)
+        for column, x in zip((self._Hm, self._Lm, self._La, self._Am, self._Aa), inputs):
+            column[index] = x
+        self._compute(index)
+
+    def set_prices(self, ws, wu, pa):
+        """
+        Replace prices in every year, to see decisions under other prices.
+        Output is left as computed, and any update recomputes both.
+        """
+        self._ws[:], self._wu[:], self._pa[:] = ws, wu, pa
+        self._changed(self._start_year)
+
+    def watch(self, economy):
+        """
+        Call economy.invalidate_firms with the first changed year
+        whenever the path is updated.
+        """
+        self._watchers.append(economy)
+
+    def unwatch(self, economy):
+        self._watchers.remove(economy)
+
+    def _changed(self, year):
+        for economy in self._watchers:
+            economy.invalidate_firms(year)
+
+    def _compute(self, index):
+        """
+        Firm equations for the years in index.
+        """
+        epsilon = self._epsilon
+        Hm, Lm, La = self._Hm[index], self._Lm[index], self._La[index]
+        Am, Aa = self._Am[index], self._Aa[index]
+        self._Ya[index] = Aa * La
+        self._Ym[index] = Am * Hm ** epsilon * Lm ** (1 - epsilon)
+        self._wu[index] = Am * (1 - epsilon) * Hm ** epsilon * Lm ** (-1 * epsilon)
+        self._ws[index] = Am * epsilon * Hm ** (epsilon - 1) * Lm ** (1 - epsilon)
+        self._pa[index] = self._wu[index] / Aa
+        self._Yt[index] = self._Ym[index] + self._pa[index] * self._Ya[index]
+        self._changed(self._start_year + (index.start or 0))
+
+    def _index(self, year):
+        i = year - self._start_year
+        if not 0 <= i < len(self._Hm):
+            raise KeyError(year)
+        return i
+
+    def get_epsilon(self):
+        return self._epsilon
+
+    def get_years(self):
+        return range(self._start_year, self._start_year + len(self._Hm))
+
+    def get_labor(self, year):
+        """
+        return labor aggregates.
+        """
+        i = self._index(year)
+        return float(self._Hm[i]), float(self._Lm[i]), float(self._La[i])
+
+    def get_tech(self, year):
+        """
+        return tech levels
+        """
+        i = self._index(year)
+        return float(self._Am[i]), float(self._Aa[i])
+
+    def get_prices(self, year):
+        """
+        return prices and wages.
+        """
+        i = self._index(year)
+        return float(self._ws[i]), float(self._wu[i]), float(self._pa[i])
+
+    def get_output(self, year):
+        """
+        Return output by sector and total.
+        """
+        i = self._index(year)
+        return float(self._Yt[i]), float(self._Ym[i]), float(self._Ya[i])
+
+    def get_input_path(self):
+        """
+        Return arrays of Hm, Lm, La, Am and Aa over all years.
+        """
+        return self._Hm, self._Lm, self._La, self._Am, self._Aa
+
+    def get_price_path(self):
+        """
+        Return arrays of ws, wu and pa over all years.
+        """
+        return self._ws, self._wu, self._pa
+
+    def get_output_path(self):
+        """
+        Return arrays of Yt, Ym and Ya over all years.
+        """
+        return self._Yt, self._Ym, self._Ya
+
+    def copy(self):
+        """
+        Make a copy of the firm path.
+        """
+        return FirmPath(self._Hm, self._Lm, self._La, self._Am, self._Aa, self._epsilon, self._start_year)
+
+    def __getitem__(self, year):
+        self._index(year)
+        return FirmView(self, year)
+
+    def __setitem__(self, year, firm):
+        Hm, Lm, La = firm.get_labor()
+        Am, Aa = firm.get_tech()
+        self.update_year(year, Hm, Lm, La, Am, Aa)
+
+    def __contains__(self, year):
+        return 0 <= year - self._start_year < len(self._Hm)
+
+    def __iter__(self):
+        return iter(self.get_years())
+
+    def __len__(self):
+        return len(self._Hm)
+
+
+
+
+def _param_property(name):
+    """
+    Read one field of a person's HouseholdParams.
+    """
+    def get(self):
+        return getattr(self._params, name)
+    return property(get)
+
+
+class Individual(object):
     """
     Describes behavior of individual.
+    Constants are one HouseholdParams, shared by copies and by people
+    built from the same params; the rest is per-person state in slots.
     """
 
+    __slots__ = ("_skill", "_age", "_nu", "_ns", "_size", "_params")
+
+    _alpha = _param_property("alpha")
+    _beta = _param_property("beta")
+    _tau_u = _param_property("tau_u")
+    _tau_s = _param_property("tau_s")
+    _ctilde = _param_property("ctilde")
+    _age_middle = _param_property("age_middle")
+    _age_old = _param_property("age_old")
+    _age_max = _param_property("age_max")
+
     def __init__(self, type, alpha = ALPHA, beta = BETA,
                  tau_u = TAU_U, tau_s = TAU_S, ctilde = CTILDE,
                  age_middle = AGE_MIDDLE, age_old = AGE_OLD, age_max = AGE_MAX,
-                 size = 1):
+                 size = 1, params = None):
         """
         Define constants for a person. Mutable objects set to 0.
+        params, a HouseholdParams, is used instead of the separate
+        constants if given.
         """
+        if params is None:
+            params = HouseholdParams(alpha, beta, tau_u, tau_s, ctilde, age_middle, age_old, age_max)
         self._skill = type
         self._age = 0
         self._ns = 0
         self._nu = 0
-        self._alpha = alpha
-        self._beta = beta
-        self._tau_u = tau_u
-        self._tau_s = tau_s
-        self._ctilde = ctilde
-        self._age_middle = age_middle
-        self._age_old = age_old
-        self._age_max = age_max
+        self._params = params
         self._size = size
 
     def copy(self):
-        new_indiv = Individual(self._skill, self._alpha, self._beta,
-                               self._tau_u, self._tau_s, self._ctilde,
-                               self._age_middle, self._age_old, self._age_max)
+        new_indiv = Individual(self._skill, params=self.get_params())
         new_indiv.update_n(self._nu, self._ns)
         new_indiv.update_age(self._age)
         return new_indiv
@@ -136,6 +431,18 @@ class Individual:
     def get_n(self):
         return self._nu, self._ns
 
+    def get_children(self):
+        """
+        Return fertility for each child type, (nu, ns) for an Individual.
+        """
+        return self.get_n()
+
+    def get_type(self):
+        return self._skill
+
+    def get_params(self):
+        return self._params
+
     def get_age(self):
         return self._age
 
@@ -146,27 +453,28 @@ class Individual:
         """
         Single period utility.
         """
+        params = self._params
         age = self._age
         # Check basic conditions for logs
-        if (ca <= self._ctilde) or (cm <= 0):
+        if (ca <= params.ctilde) or (cm <= 0):
             return float("-inf")
 
         # Normal Calculations
-        if age < self._age_middle:
+        if age < params.age_middle:
             return 0
-        elif age < self._age_old:
-            if (wage * (1 - (self._tau_u * self._nu + self._tau_s * self._ns))) < ((cm + price * ca) - .001): #adjustment for floating point.
+        elif age < params.age_old:
+            if (wage * (1 - (params.tau_u * self._nu + params.tau_s * self._ns))) < ((cm + price * ca) - .001): #adjustment for floating point.
                 return float("-inf")
             elif max(self._ns, self._nu) <= 0:
                 return float("-inf")
             else:
-                return (self._alpha * math.log(cm) + self._beta * math.log(ca - self._ctilde)
-                        + (1 - self._alpha - self._beta) * math.log(omegau * self._nu + omegas * self._ns))
-        elif age >= self._age_old and age <= self._age_max:
+                return (params.alpha * math.log(cm) + params.beta * math.log(ca - params.ctilde)
+                        + (1 - params.alpha - params.beta) * math.log(omegau * self._nu + omegas * self._ns))
+        elif age >= params.age_old and age <= params.age_max:
             if wage < cm + price * ca - .001:
                 return float("-inf")
             else:
-                return self._alpha * math.log(cm) + self._beta * math.log(ca - self._ctilde)
+                return params.alpha * math.log(cm) + params.beta * math.log(ca - params.ctilde)
         else:
             return None
 
@@ -174,94 +482,848 @@ class Individual:
         """
         Get optimal consumption conditional on prices and fertility.
         """
-        if self._age < self._age_middle:
+        params = self._params
+        if self._age < params.age_middle:
             return 0, 0
         else:
-            if (self._age >= self._age_middle) and (self._age < self._age_old):
-                working_time = (1 - self._tau_u * self._nu - self._tau_s * self._ns)
-            elif self._age >= self._age_old:
+            if (self._age >= params.age_middle) and (self._age < params.age_old):
+                working_time = (1 - params.tau_u * self._nu - params.tau_s * self._ns)
+            elif self._age >= params.age_old:
                 working_time = 1
             else:
                 assert False, "age error"
-            ratio = (self._beta / self._alpha)
-            numerator = ratio * (working_time * wage - price * self._ctilde)
+            ratio = (params.beta / params.alpha)
+            numerator = ratio * (working_time * wage - price * params.ctilde)
             denominator = (1 + ratio)
             c_m = numerator / denominator
             c_a = (wage * working_time - c_m) / price
             return c_m, c_a
 
     def get_gamma(self):
-        return self._ns * self._tau_s + self._nu * self._tau_u
+        return self._ns * self._params.tau_s + self._nu * self._params.tau_u
 
     def work(self):
-        return ((self._age >= self._age_middle) and (self._age <= self._age_max))
+        return ((self._age >= self._params.age_middle) and (self._age <= self._params.age_max))
 
-    def maximize_n(self, wages, prices, omegau, omegas, last_ratio, tolw=TOLW, nvector=NVECTOR):
+    def plan(self, wages, prices, omegau, omegas):
         """
-        Choose maximum number of children.
+        Return a UtilityPlan for this person at their current age.
+        """
+        return UtilityPlan(self.get_params(), self._age, wages, prices, omegau, omegas)
+
+    def lifetime_utility(self, nu, ns, wages, prices, omegau, omegas):
+        """
+        Utility summed over periods for arrays of fertility choices.
+        Batched version of get_consumption and utility, with infeasible
+        points at -inf. Scores through a UtilityPlan.
+        """
+        return self.plan(wages, prices, omegau, omegas).values(nu, ns)
+
+    def child_mix(self, omegau, omegas, last_ratio, tolw=TOLW):
+        """
+        Direction (nu, ns) per unit of fertility.
         First check taus against omega.
         With both types of children, keep ratio from last iteration.
-        :type self: object
         """
-        new_indiv = self.copy()
-        if (omegas / omegau) > ((self._tau_s / self._tau_u) + tolw):
-            final_n = (0, 0)
-            best = float("-inf")
-            for n in nvector:
-                new_indiv.update_n(0, n)
-                utils = sum([new_indiv.utility(wages[i], prices[i], new_indiv.get_consumption(wages[i], prices[i])[0],
-                                          new_indiv.get_consumption(wages[i], prices[i])[1], omegau, omegas)
-                             for i in range(len(prices))])
-                if utils > best:
-                    final_n = (0, n)
-                    best = utils
-
-        elif (omegas / omegau) < ((self._tau_s / self._tau_u) - tolw):
-            final_n = (0, 0)
-            best = float("-inf")
-            for n in nvector:
-                new_indiv.update_n(n, 0)
-                utils = sum([new_indiv.utility(wages[i], prices[i], new_indiv.get_consumption(wages[i], prices[i])[0],
-                                          new_indiv.get_consumption(wages[i], prices[i])[1], omegau, omegas)
-                             for i in range(len(prices))])
-                if utils > best:
-                    final_n = (n, 0)
-                    best = utils
-
-        elif ((omegas / omegau) <= ((self._tau_s / self._tau_u) + tolw)
-              and (omegas / omegau) >= ((self._tau_s / self._tau_u) - tolw)):
-            final_n = (0, 0)
-            best = float("-inf")
-            for nlow in nvector:
-                nhigh = nlow * last_ratio
-                new_indiv.update_n(nlow, nhigh)
-                utils = sum([new_indiv.utility(wages[i], prices[i], new_indiv.get_consumption(wages[i], prices[i])[0],
-                                          new_indiv.get_consumption(wages[i], prices[i])[1], omegau, omegas)
-                             for i in range(len(prices))])
-                if utils > best:
-                    final_n = (nlow, nhigh)
-                    best = utils
+        params = self._params
+        if (omegas / omegau) > ((params.tau_s / params.tau_u) + tolw):
+            return 0, 1
+        elif (omegas / omegau) < ((params.tau_s / params.tau_u) - tolw):
+            return 1, 0
+        elif ((omegas / omegau) <= ((params.tau_s / params.tau_u) + tolw)
+              and (omegas / omegau) >= ((params.tau_s / params.tau_u) - tolw)):
+            return 1, last_ratio
         else:
             assert False, "No condition met"
 
+    def _golden_n(self, mix, wages, prices, omegau, omegas, xtol):
+        """
+        Golden-section search along mix on [0, 1 / time cost of one unit].
+        The objective is concave where feasible and -inf to the right of
+        the feasible set, so infinite ties move the bracket left and
+        finite ties keep the part between the two points.
+        """
+        params = self._params
+        du, ds = mix
+        a = 0.0
+        b = 1.0 / (params.tau_u * du + params.tau_s * ds)
+        plan = self.plan(wages, prices, omegau, omegas)
+        value = lambda n: plan.value(n * du, n * ds)
+        c = b - GOLDEN * (b - a)
+        d = a + GOLDEN * (b - a)
+        fc = value(c)
+        fd = value(d)
+        while b - a > xtol:
+            if fc == fd > float("-inf"):
+                # Flat to rounding, so the optimum is between c and d.
+                a, b = c, d
+                c = b - GOLDEN * (b - a)
+                d = a + GOLDEN * (b - a)
+                fc = value(c)
+                fd = value(d)
+            elif fc >= fd:
+                b, d, fd = d, c, fc
+                c = b - GOLDEN * (b - a)
+                fc = value(c)
+            else:
+                a, c, fc = c, d, fd
+                d = a + GOLDEN * (b - a)
+                fd = value(d)
+        n = (a + b) / 2
+        if value(n) > float("-inf"):
+            return n
+        return 0.0
+
+    def _adaptive_n(self, mix, wages, prices, omegau, omegas, xtol, points=ADAPTIVE_POINTS):
+        """
+        Coarse-to-fine grid search along mix.
+        The first pass spans [0, top], where top is the fertility at which
+        some period's spending on goods above subsistence reaches zero, and
+        is halved while no point is feasible.
+        Each later pass spans the two spacings around the best point,
+        until the spacing is below xtol or utility no longer changes.
+        """
+        params = self._params
+        du, ds = mix
+        wage = np.asarray(wages, dtype=float)
+        price = np.asarray(prices, dtype=float)
+        top = ((wage - price * params.ctilde) / (wage * (params.tau_u * du + params.tau_s * ds))).min()
+        if not top > 0:
+            return 0.0
+        plan = self.plan(wages, prices, omegau, omegas)
+        value = lambda n: plan.values(n * du, n * ds)
+        for _ in range(64):
+            grid = np.linspace(0, top, points)
+            utils = value(grid)
+            best = int(np.argmax(utils))
+            if utils[best] > float("-inf"):
+                break
+            top = top / 2
+        else:
+            return 0.0
+
+        step = grid[1] - grid[0]
+        while step > xtol:
+            grid = np.linspace(max(grid[best] - step, 0), grid[best] + step, points)
+            utils = value(grid)
+            # Near the optimum utility is flat to rounding; take the middle tie.
+            ties = np.flatnonzero(utils == utils.max())
+            best = int(ties[len(ties) // 2])
+            if len(ties) == points:
+                break
+            step = grid[1] - grid[0]
+        return float(grid[best])
+
+    def _newton_n(self, mix, wages, prices, omegau, omegas, xtol):
+        """
+        Solve the first order condition along mix.
+        With ws = wage * working_time - price * ctilde, the objective is
+        (alpha + beta) * sum(log(ws)) + periods * (1 - alpha - beta) * log(n),
+        up to constants. Each period's ws hits zero at m_i, and when all m_i
+        agree the optimum is n = (1 - alpha - beta) * m. Otherwise Newton
+        steps on the FOC are bracketed in (0, min m_i) and fall back to
+        bisection.
+        """
+        params = self._params
+        assert params.age_middle <= self._age < params.age_old, "age error"
+        du, ds = mix
+        cost = params.tau_u * du + params.tau_s * ds
+        wage = np.asarray(wages, dtype=float)
+        price = np.asarray(prices, dtype=float)
+        periods = len(wage)
+        roots = (wage - price * params.ctilde) / (wage * cost)
+        top = roots.min()
+        if top <= 0 or omegau * du + omegas * ds <= 0:
+            return 0.0
+        kids = periods * (1 - params.alpha - params.beta)
+        goods = params.alpha + params.beta
+        n = (1 - params.alpha - params.beta) * top
+        if roots.max() - top <= xtol:
+            return n
+        lo, hi = 0.0, top
+        for _ in range(100):
+            slope = kids / n - goods * (1 / (roots - n)).sum()
+            if slope > 0:
+                lo = n
+            else:
+                hi = n
+            curve = -kids / n ** 2 - goods * (1 / (roots - n) ** 2).sum()
+            step = n - slope / curve
+            if not lo < step < hi:
+                step = (lo + hi) / 2
+            if abs(step - n) <= xtol or hi - lo <= xtol:
+                return step
+            n = step
+        return n
+
+    def _table_n(self, mix, wages, prices, omegau, omegas):
+        """
+        Look up the optimum along mix in a PolicyTable.
+        """
+        params = self._params
+        assert params.age_middle <= self._age < params.age_old, "age error"
+        du, ds = mix
+        wage = np.array(wages, dtype=float, ndmin=2)
+        price = np.array(prices, dtype=float, ndmin=2)
+        table = get_policy_table(params.alpha, params.beta, wage.shape[1])
+        return float(table.solve(np.array([params.ctilde]), np.array([params.tau_u * du + params.tau_s * ds]),
+                                 np.array([omegau * du + omegas * ds]), wage, price)[0])
+
+    def maximize_n(self, wages, prices, omegau, omegas, last_ratio, tolw=TOLW, nvector=NVECTOR,
+                   method="grid", xtol=XTOL, cache=None):
+        """
+        Choose maximum number of children.
+        The direction comes from child_mix. method="grid" scores the whole
+        of nvector in one call to lifetime_utility; "adaptive" refines a
+        coarse grid up to the largest feasible fertility, "golden" runs a
+        golden-section search and "newton" solves the first order
+        condition. The last three have no upper grid limit. newton is within xtol. adaptive
+        and golden compare utilities, which are flat to rounding within
+        about 1e-7 of the optimum, so they stop there when xtol is
+        smaller. "table" looks the answer up in the PolicyTable of the
+        person's parameters, and is within that table's tolerance.
+        With a HouseholdCache, earlier answers to the same problem are reused.
+        :type self: object
+        """
+        if cache is not None:
+            key = cache.key(self.get_params(), self._age, wages, prices, omegau, omegas, last_ratio,
+                            tolw, nvector, method, xtol)
+            found = cache.get(key)
+            if found is not None:
+                return found
+
+        du, ds = self.child_mix(omegau, omegas, last_ratio, tolw)
+        if method == "grid":
+            grid = np.asarray(nvector, dtype=float)
+            nu, ns = grid * du, grid * ds
+            utils = self.lifetime_utility(nu, ns, wages, prices, omegau, omegas)
+            best = int(np.argmax(utils))
+            if utils[best] > float("-inf"):
+                final_n = (float(nu[best]), float(ns[best]))
+            else:
+                final_n = (0, 0)
+        elif method in ("adaptive", "golden", "newton", "table"):
+            if method == "table":
+                n = self._table_n((du, ds), wages, prices, omegau, omegas)
+            elif method == "adaptive":
+                n = self._adaptive_n((du, ds), wages, prices, omegau, omegas, xtol)
+            elif method == "golden":
+                n = self._golden_n((du, ds), wages, prices, omegau, omegas, xtol)
+            else:
+                n = self._newton_n((du, ds), wages, prices, omegau, omegas, xtol)
+            final_n = (float(n * du), float(n * ds))
+        else:
+            raise ValueError("Unknown method: %s" % method)
+
         assert final_n[0] >= 0 and final_n[1] >= 0
         assert max(final_n) > 0
-        assert max(final_n) != max(nvector)
+        if method == "grid":
+            assert max(final_n) != max(nvector)
 
+        if cache is not None:
+            cache.put(key, final_n)
         return final_n
 
 
+class UtilityPlan:
+    """
+    Lifetime utility of one person facing fixed wages, prices and omega,
+    as a function of fertility. With z = wage * working_time - price *
+    ctilde, consumption is c_m = share * z and c_a - ctilde =
+    (1 - share) * z / price, so each period adds (alpha + beta) * log(z)
+    and a constant. Everything but z is computed once. value scores one
+    choice with math.log; values scores arrays in reused work buffers.
+    """
+
+    def __init__(self, params, age, wages, prices, omegau, omegas):
+        wage = np.array(wages, dtype=float).ravel()
+        price = np.array(prices, dtype=float).ravel()
+        alpha, beta = params.alpha, params.beta
+        share = (beta / alpha) / (1 + beta / alpha)
+        self._goods = alpha + beta
+        self._kids = len(wage) * (1 - alpha - beta)
+        self._omegau = omegau
+        self._omegas = omegas
+        self._base = (wage - price * params.ctilde).reshape(-1, 1)
+        self._cost_u = (wage * params.tau_u).reshape(-1, 1)
+        self._cost_s = (wage * params.tau_s).reshape(-1, 1)
+        self._periods = tuple(zip(self._base.ravel().tolist(), self._cost_u.ravel().tolist(),
+                                  self._cost_s.ravel().tolist()))
+        self._buffers = {}
+        if 0 < share < 1 and (price > 0).all():
+            self._constant = (len(wage) * (alpha * math.log(share) + beta * math.log(1 - share))
+                              - beta * float(np.log(price).sum()))
+        else:
+            self._constant = float("-inf")
+
+        # Utility that does not depend on fertility, or None at middle age.
+        if age < params.age_middle:
+            # Too young to consume, so log(cm) is never defined.
+            self._fixed = float("-inf")
+        elif age < params.age_old:
+            self._fixed = None
+        elif age <= params.age_max:
+            if (self._base > 0).all():
+                self._fixed = self._goods * float(np.log(self._base).sum()) + self._constant
+            else:
+                self._fixed = float("-inf")
+        else:
+            assert False, "age error"
+
+    def value(self, nu, ns):
+        """
+        Utility of a single choice.
+        """
+        if self._fixed is not None:
+            return self._fixed
+        kids = self._omegau * nu + self._omegas * ns
+        if not (max(nu, ns) > 0 and kids > 0):
+            return float("-inf")
+        total = 0.0
+        for base, cost_u, cost_s in self._periods:
+            z = base - cost_u * nu - cost_s * ns
+            if not z > 0:
+                return float("-inf")
+            total += math.log(z)
+        return self._goods * total + self._constant + self._kids * math.log(kids)
+
+    def values(self, nu, ns, out=None):
+        """
+        Utility of arrays of choices, written to out if given.
+        """
+        nu = np.asarray(nu, dtype=float)
+        ns = np.asarray(ns, dtype=float)
+        if out is None:
+            out = np.empty(nu.shape)
+        if self._fixed is not None:
+            out.fill(self._fixed)
+            return out
+        size = nu.size
+        if size not in self._buffers:
+            periods = len(self._base)
+            self._buffers[size] = (np.empty((periods, size)), np.empty((periods, size)), np.empty(size),
+                                   np.empty(size), np.empty(size, dtype=bool), np.empty(size, dtype=bool))
+        z, work, kids, scratch, bad, flag = self._buffers[size]
+        flat = out.reshape(size)
+        nu, ns = nu.reshape(size), ns.reshape(size)
+        np.multiply(self._cost_u, nu, out=z)
+        np.multiply(self._cost_s, ns, out=work)
+        np.subtract(self._base, z, out=z)
+        np.subtract(z, work, out=z)
+        np.less_equal(z, 0, out=work)
+        np.any(work, axis=0, out=bad)
+        np.multiply(self._omegau, nu, out=kids)
+        np.multiply(self._omegas, ns, out=scratch)
+        kids += scratch
+        np.maximum(nu, ns, out=scratch)
+        np.less_equal(scratch, 0, out=flag)
+        np.logical_or(bad, flag, out=bad)
+        np.less_equal(kids, 0, out=flag)
+        np.logical_or(bad, flag, out=bad)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.log(z, out=z)
+            np.log(kids, out=kids)
+        np.sum(z, axis=0, out=flat)
+        flat *= self._goods
+        flat += self._constant
+        kids *= self._kids
+        flat += kids
+        flat[bad] = float("-inf")
+        return out
+
+
+class HouseholdCache:
+    """
+    Bounded least-recently-used store of maximize_n answers.
+    Keys hold the person's parameters and age, the solver options and the
+    inputs rounded to multiples of tolerance, so problems closer than
+    that share an answer. A tolerance of 0 only matches exact inputs.
+    nvector is keyed by its length and end points.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, tolerance=CACHE_TOLERANCE):
+        self._maxsize = maxsize
+        self._tolerance = tolerance
+        self._store = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def _round(self, values):
+        if self._tolerance:
+            return tuple(int(round(x / self._tolerance)) for x in values)
+        return tuple(float(x) for x in values)
+
+    def key(self, params, age, wages, prices, omegau, omegas, last_ratio, tolw, nvector, method, xtol):
+        """
+        Lookup key for one household problem.
+        """
+        if method == "grid":
+            grid = (len(nvector), nvector[0], nvector[-1])
+        else:
+            grid = xtol
+        return (tuple(params), age, method, tolw, grid, self._round(wages), self._round(prices),
+                self._round((omegau, omegas, last_ratio)))
+
+    def get(self, key):
+        """
+        Return the stored answer for key, or None.
+        """
+        if key in self._store:
+            self._hits += 1
+            value = self._store.pop(key)
+            self._store[key] = value
+            return value
+        self._misses += 1
+        return None
+
+    def put(self, key, value):
+        self._store[key] = value
+        if len(self._store) > self._maxsize:
+            self._store.popitem(last=False)
+
+    def get_tolerance(self):
+        return self._tolerance
+
+    def get_stats(self):
+        """
+        Return hits, misses and number of stored answers.
+        """
+        return self._hits, self._misses, len(self._store)
+
+    def clear(self):
+        self._store.clear()
+        self._hits = 0
+        self._misses = 0
+
+
+class PolicyTable:
+    """
+    Optimal fertility along a direction, tabulated once per alpha, beta
+    and number of working periods. Along a direction, income in each
+    period hits zero at the root m_i = (wage - price * ctilde) /
+    (wage * cost), and the optimum divided by min(m) depends only on the
+    ratios min(m) / m_i of the other periods, which lie in [0, 1]. The
+    table holds it on a grid of about size points over those ratios and
+    lookups interpolate multilinearly. The first order condition h(n) = 0
+    has h decreasing, so an answer n is within tolerance of the optimum
+    when h changes sign between n - tolerance and n + tolerance. Answers
+    that fail this, and problems with more than TABLE_AXES ratios, are
+    solved exactly with _newton_roots.
+    """
+
+    def __init__(self, alpha, beta, periods, size=TABLE_SIZE, tolerance=TABLE_TOLERANCE):
+        self._alpha = alpha
+        self._beta = beta
+        self._periods = periods
+        self._tolerance = tolerance
+        self._lookups = 0
+        self._fallbacks = 0
+        axes = periods - 1
+        if axes > TABLE_AXES:
+            self._values = None
+            return
+        points = max(2, int(round(size ** (1. / axes)))) if axes else 2
+        self._points = points
+        grid = np.linspace(0., 1., points)
+        ratios = np.array(list(itertools.product(grid, repeat=axes))).reshape(points ** axes, axes)
+        with np.errstate(divide="ignore"):
+            roots = np.column_stack((np.ones(len(ratios)), 1 / ratios))
+        size = len(ratios)
+        self._values = _newton_roots(np.full(size, alpha), np.full(size, beta), roots,
+                                     XTOL).reshape((points,) * axes)
+
+    def solve(self, ctilde, cost, omega, wage, price):
+        """
+        n for arrays of households, as _newton_batch.
+        """
+        roots = (wage - price * ctilde[:, np.newaxis]) / (wage * cost[:, np.newaxis])
+        zero = (roots.min(axis=1) <= 0) | (omega <= 0)
+        n = np.zeros(len(roots))
+        self._lookups += len(roots)
+        if self._values is None:
+            exact = ~zero
+        else:
+            n, exact = self._interpolate(roots, zero)
+        if exact.any():
+            size = int(exact.sum())
+            self._fallbacks += size
+            n[exact] = _newton_roots(np.full(size, self._alpha), np.full(size, self._beta), roots[exact], XTOL)
+        return n
+
+    def _interpolate(self, roots, zero):
+        """
+        Interpolated n, and where it is not within tolerance.
+        """
+        top = np.where(zero, 1., roots.min(axis=1))
+        ratios = np.sort(top[:, np.newaxis] / np.where(zero[:, np.newaxis], 1., roots), axis=1)[:, :-1]
+        position = ratios * (self._points - 1)
+        index = np.minimum(position.astype(int), self._points - 2)
+        weight = position - index
+        scaled = np.zeros(len(roots))
+        for corner in itertools.product((0, 1), repeat=ratios.shape[1]):
+            share = np.ones(len(roots))
+            for axis, side in enumerate(corner):
+                share *= weight[:, axis] if side else 1 - weight[:, axis]
+            scaled += share * self._values[tuple((index + np.array(corner, dtype=int)).T)]
+        n = np.where(zero, 0., scaled * top)
+
+        kids = self._periods * (1 - self._alpha - self._beta)
+        goods = self._alpha + self._beta
+        with np.errstate(divide="ignore", invalid="ignore"):
+            below, above = [kids / x - goods * (1 / (roots - x[:, np.newaxis])).sum(axis=1)
+                            for x in (n - self._tolerance, n + self._tolerance)]
+        exact = ~zero & ~((below > 0) & (above < 0))
+        return n, exact
+
+    def get_stats(self):
+        """
+        Return the number of households looked up and solved exactly.
+        """
+        return self._lookups, self._fallbacks
+
+
+def get_policy_table(alpha, beta, periods):
+    """
+    The PolicyTable for these parameters, built on first use.
+    """
+    key = (alpha, beta, periods)
+    if key not in _policy_tables:
+        _policy_tables[key] = PolicyTable(alpha, beta, periods)
+    return _policy_tables[key]
+
+
+def _column_property(name):
+    """
+    Read and write one CohortTable column through a CohortView.
+    """
+    def get(self):
+        return self._table.get_value(name, self._year, self._slot)
+
+    def set(self, value):
+        self._table.set_value(name, self._year, self._slot, value)
+    return property(get, set)
+
+
+class CohortView(Individual):
+    """
+    An Individual whose state lives in a row of a CohortTable.
+    Updates write through to the table.
+    """
+
+    __slots__ = ("_table", "_year", "_slot")
+
+    _skill = _column_property("skill")
+    _age = _column_property("age")
+    _nu = _column_property("nu")
+    _ns = _column_property("ns")
+    _size = _column_property("size")
+    # The row's shared parameter block.
+    _params = property(lambda self: self._table.get_block(self._year, self._slot))
+
+    def __init__(self, table, year, slot):
+        self._table = table
+        self._year = year
+        self._slot = slot
+
+    def get_children(self):
+        """
+        Return fertility for each of the table's child types.
+        """
+        return tuple(self._table.get_children(self._year, self._slot))
+
+
+class CohortTable:
+    """
+    Cohorts stored as columns, one row per birth year and one slot per
+    skill type. Fertility n and the time cost tau of each child have a
+    further axis over child types, in slot order, so with two types
+    n[..., 0] is nu and n[..., 1] is ns. Parameters are stored once per
+    distinct HouseholdParams and rows keep an index into them. Indexing
+    by year gives a tuple of CohortView objects, so a table can stand in
+    for a dictionary of Individual pairs.
+    """
+
+    _columns = ("present", "skill", "block", "n", "tau", "size", "age")
+    # Columns reached through CohortView as (column, child type).
+    _children = {"nu": ("n", 0), "ns": ("n", 1)}
+
+    def __init__(self, width=2):
+        """
+        Empty table with width skill types per birth year.
+        """
+        self._width = width
+        self._first = 0
+        self._count = 0
+        self._present = np.zeros(0, dtype=bool)
+        self._skill = np.zeros((0, width), dtype=int)
+        self._block = np.zeros((0, width), dtype=int)
+        self._n = np.zeros((0, width, width))
+        self._tau = np.zeros((0, width, width))
+        self._size = np.zeros((0, width))
+        self._age = np.zeros((0, width), dtype=int)
+        self._skills = []
+        self._skill_codes = {}
+        self._blocks = []
+        self._block_codes = {}
+
+    def _code(self, values, codes, value):
+        """
+        Index of a skill label or parameter block, added if new.
+        """
+        if value not in codes:
+            codes[value] = len(values)
+            values.append(value)
+        return codes[value]
+
+    def _reserve(self, year1, year2):
+        """
+        Grow columns to cover years year1 to year2.
+        Appending doubles capacity, so adding years one by one is cheap.
+        """
+        if self._count == 0:
+            self._first = year1
+        first = min(self._first, year1)
+        last = max(self._first + self._count - 1, year2)
+        shift = self._first - first
+        needed = last - first + 1
+        if shift == 0 and needed <= len(self._present):
+            self._count = needed
+            return
+        capacity = needed if shift else max(needed, 2 * len(self._present))
+        for name in self._columns:
+            old = getattr(self, "_" + name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[shift:shift + self._count] = old[:self._count]
+            setattr(self, "_" + name, new)
+        self._first = first
+        self._count = needed
+
+    def _row(self, year):
+        i = year - self._first
+        if not (0 <= i < self._count and self._present[i]):
+            raise KeyError(year)
+        return i
+
+    def set_cohorts(self, year, indivs, taus=None):
+        """
+        Store a tuple of Individuals born in year, one per skill type,
+        each with fertility for every child type.
+        taus are the time costs of each child type, by default tau_u and
+        tau_s of each person's parameters.
+        """
+        assert len(indivs) == self._width, "width error"
+        rows = [(person.get_type(), person.get_params(), person.get_children(), person.get_size(),
+                 person.get_age()) for person in indivs]
+        assert all(len(n) == self._width for skill, params, n, size, age in rows), "width error"
+        self._reserve(year, year)
+        i = year - self._first
+        for k, (skill, params, n, size, age) in enumerate(rows):
+            self._skill[i, k] = self._code(self._skills, self._skill_codes, skill)
+            self._block[i, k] = self._code(self._blocks, self._block_codes, params)
+            self._n[i, k] = n
+            self._tau[i, k] = (params.tau_u, params.tau_s) if taus is None else taus
+            self._size[i, k] = size
+            self._age[i, k] = age
+        self._present[i] = True
+
+    def fill(self, year1, year2, n, skills=("low", "high"), params=None, size=1, taus=None):
+        """
+        Add identical cohorts for every year between year1 and year2.
+        n is fertility over child types, or one such row per skill type.
+        taus are the time costs of each child type, by default tau_u and
+        tau_s of params.
+        """
+        if params is None:
+            params = Individual(skills[0]).get_params()
+        if taus is None:
+            taus = (params.tau_u, params.tau_s)
+        self._reserve(year1, year2)
+        rows = slice(year1 - self._first, year2 - self._first + 1)
+        self._skill[rows] = [self._code(self._skills, self._skill_codes, skill) for skill in skills]
+        self._block[rows] = self._code(self._blocks, self._block_codes, params)
+        self._n[rows] = n
+        self._tau[rows] = taus
+        self._size[rows] = size
+        self._age[rows] = 0
+        self._present[rows] = True
+
+    def get_value(self, name, year, slot):
+        if name in self._children:
+            name, child = self._children[name]
+            return self._n[self._row(year), slot, child].item()
+        value = getattr(self, "_" + name)[self._row(year), slot]
+        if name == "skill":
+            return self._skills[value]
+        return value.item()
+
+    def get_children(self, year, slot):
+        return self._n[self._row(year), slot].tolist()
+
+    def set_value(self, name, year, slot, value):
+        if name in self._children:
+            name, child = self._children[name]
+            self._n[self._row(year), slot, child] = value
+            return
+        if name == "skill":
+            value = self._code(self._skills, self._skill_codes, value)
+        getattr(self, "_" + name)[self._row(year), slot] = value
+
+    def get_rows(self, year1, year2):
+        """
+        Return the slice of rows for cohorts born between two given years.
+        """
+        self._row(year1)
+        self._row(year2)
+        return slice(year1 - self._first, year2 - self._first + 1)
+
+    def set_n(self, year1, year2, n):
+        """
+        Set fertility of cohorts born between two given years.
+        """
+        self._n[self.get_rows(year1, year2)] = n
+
+    def get_block(self, year, slot):
+        return self._blocks[self._block[self._row(year), slot]]
+
+    def get_birth(self):
+        """
+        Return birth year of each row.
+        """
+        return np.arange(self._first, self._first + self._count)
+
+    def get_present(self):
+        return self._present[:self._count]
+
+    def get_n(self):
+        """
+        Return fertility columns for each child type, as (nu, ns) with two types.
+        """
+        return tuple(self._n[:self._count, :, child] for child in range(self._width))
+
+    def get_fertility(self):
+        """
+        Return fertility by row, skill type and child type.
+        """
+        return self._n[:self._count]
+
+    def get_tau(self):
+        """
+        Return time cost by row, skill type and child type.
+        """
+        return self._tau[:self._count]
+
+    def get_width(self):
+        return self._width
+
+    def get_size(self):
+        return self._size[:self._count]
+
+    def get_age(self):
+        return self._age[:self._count]
+
+    def get_skill(self):
+        """
+        Return skill labels of each row and slot.
+        """
+        return np.array(self._skills, dtype=object)[self._skill[:self._count]]
+
+    def get_param(self, name):
+        """
+        Return a parameter for each row and slot.
+        """
+        values = np.array([getattr(block, name) for block in self._blocks])
+        return values[self._block[:self._count]]
+
+    def get_gamma(self):
+        """
+        Return time spent raising children for each row and slot.
+        """
+        return (self.get_fertility() * self.get_tau()).sum(axis=-1)
+
+    def update_age(self, year):
+        """
+        Set every cohort's age as of year.
+        """
+        self._age[:self._count] = year - self.get_birth()[:, np.newaxis]
+
+    def get_arrays(self):
+        """
+        Return the table as a dictionary of arrays, for saving.
+        """
+        arrays = dict(("cohort_" + name, getattr(self, "_" + name)[:self._count]) for name in self._columns)
+        arrays["cohort_first"] = np.array(self._first)
+        arrays["cohort_skills"] = np.array(self._skills, dtype=str)
+        arrays["cohort_blocks"] = np.array(self._blocks, dtype=float).reshape(-1, len(HouseholdParams._fields))
+        return arrays
+
+    def set_arrays(self, arrays):
+        """
+        Replace the table with arrays from get_arrays.
+        """
+        for name in self._columns:
+            setattr(self, "_" + name, np.array(arrays["cohort_" + name]))
+        self._width = self._skill.shape[1]
+        self._first = int(arrays["cohort_first"])
+        self._count = len(self._present)
+        self._skills = [str(skill) for skill in arrays["cohort_skills"]]
+        self._skill_codes = dict((skill, i) for i, skill in enumerate(self._skills))
+        self._blocks = [_make_params(values) for values in arrays["cohort_blocks"]]
+        self._block_codes = dict((block, i) for i, block in enumerate(self._blocks))
+
+    def keys(self):
+        return [year for year in self]
+
+    def items(self):
+        return [(year, self[year]) for year in self]
+
+    def __getitem__(self, year):
+        self._row(year)
+        return tuple(CohortView(self, year, k) for k in range(self._width))
+
+    def __setitem__(self, year, indivs):
+        self.set_cohorts(year, indivs)
+
+    def __contains__(self, year):
+        i = year - self._first
+        return 0 <= i < self._count and bool(self._present[i])
+
+    def __iter__(self):
+        return iter(self.get_birth()[self.get_present()].tolist())
+
+    def __len__(self):
+        return int(self.get_present().sum())
+
+
 class Economy:
     """
     Class for the entire economy.
     """
 
-    def __init__(self, start_time, end_time, bigB = B, delta = DELTA, eta_m = ETA_M, eta_a = ETA_A):
+    def __init__(self, start_time, end_time, bigB = B, delta = DELTA, eta_m = ETA_M, eta_a = ETA_A,
+                 omega_start = OMEGA_START, omega_end = OMEGA_END, epsilon = EPSILON, params = None,
+                 types = None):
         """
         Initialize firms and individuals within the class.
+        omega_start and omega_end bound the years ahead summed by get_omega.
+        params are the HouseholdParams of people from add_all_indivs and
+        of labor_allocation in build_firms; epsilon is passed to firms.
+        types is a sequence of SkillType, by default "low" and "high"
+        with the child costs tau_u and tau_s of params. Each type is a
+        slot of the cohort table and a child type of fertility.
         """
+        if params is None:
+            params = Individual("low").get_params()
+        if types is None:
+            types = (SkillType("low", "low", params.tau_u), SkillType("high", "high", params.tau_s))
+        for skill in types:
+            if skill.labor not in LABOR:
+                raise ValueError("Unknown labor: %s" % (skill.labor,))
+        self._types = tuple(SkillType(*skill) for skill in types)
+        self._labor_of = dict((skill.label, LABOR.index(skill.labor)) for skill in self._types)
+        # Labor of each child type, 0 for low and 1 for high.
+        self._child_labor = np.array([self._labor_of[skill.label] for skill in self._types])
         self._firm_dict = {}
-        self._indiv_dict = {}
+        self._indiv_dict = CohortTable(len(self._types))
         self._pop_dict = {}
         self._supply_dict = {}
         self._start_time = start_time
@@ -270,13 +1332,74 @@ class Economy:
         self._delta = delta
         self._eta_m = eta_m
         self._eta_a = eta_a
+        self._omega_start = omega_start
+        self._omega_end = omega_end
+        self._epsilon = epsilon
+        self._params = params
+        # Prefix sums of wu, ws and missing years behind get_omega.
+        self._omega_first = None
+        self._omega_cum = None
+        self._omega_dirty = float("-inf")
+        # First birth year whose fertility changed since the last refresh;
+        # nothing is built yet, so everything starts dirty.
+        self._dirty = float("-inf")
+        self._refreshed = []
 
     def add_indivs(self, indivs, year):
-        low_skill, high_skill = indivs
-        self._indiv_dict[year] = (low_skill, high_skill)
+        """
+        Store one Individual per skill type born in year. Child time
+        costs come from the economy's types.
+        """
+        self._indiv_dict.set_cohorts(year, tuple(indivs), [skill.tau for skill in self._types])
+        self.mark_dirty(year)
+
+    def mark_dirty(self, year):
+        """
+        Mark cohorts from birth year onward as changed.
+        Needed after editing people in the table directly.
+        """
+        self._dirty = min(self._dirty, year)
 
     def add_firm(self, firm, year):
-        self._firm_dict[year] = firm
+        """
+        Store a firm for year, watched so that updating it in place
+        invalidates get_omega. With a FirmPath, the firm is written into
+        the path, which must already cover the year.
+        """
+        firms = self._firm_dict
+        if isinstance(firms, FirmPath):
+            firms[year] = firm
+            return
+        if year in firms:
+            firms[year].unwatch(self, year)
+        firms[year] = firm
+        firm.watch(self, year)
+        self.invalidate_firms(year)
+
+    def add_firm_path(self, firm_path):
+        """
+        Use a FirmPath for all firms. add_firm then writes into the path,
+        so it must already cover the year.
+        """
+        self._unwatch_firms()
+        self._firm_dict = firm_path
+        firm_path.watch(self)
+        self.invalidate_firms(float("-inf"))
+
+    def _unwatch_firms(self):
+        firms = self._firm_dict
+        if isinstance(firms, FirmPath):
+            firms.unwatch(self)
+        else:
+            for year in firms:
+                firms[year].unwatch(self, year)
+
+    def invalidate_firms(self, year):
+        """
+        Mark firm prices from year onward as changed.
+        Stored firms and paths call this when they are updated.
+        """
+        self._omega_dirty = min(self._omega_dirty, year)
 
     def get_indivs(self):
         return self._indiv_dict
@@ -288,13 +1411,13 @@ class Economy:
         """
         A shortcut for adding individuals in all years.
         Useful to initializing in loop.
+        Every person has in_nu children of each low type and in_ns of
+        each high type.
         """
-        for t in range(year1, year2 + 1):
-            new_low = Individual("low")
-            new_low.update_n(in_nu, in_ns)
-            new_high = Individual("high")
-            new_high.update_n(in_nu, in_ns)
-            self.add_indivs((new_low, new_high), t)
+        n = np.where(self._child_labor == 1, in_ns, in_nu)
+        self._indiv_dict.fill(year1, year2, n, [skill.label for skill in self._types], self._params,
+                              taus=[skill.tau for skill in self._types])
+        self.mark_dirty(year1)
 
     def labor_allocation(self, l_tilde, N, Aa, ctilde = CTILDE, beta = BETA, alpha = ALPHA, epsilon = EPSILON):
         """
@@ -306,66 +1429,506 @@ class Economy:
         return l_man
 
 
-    def build_aggregate(self):
+    def build_aggregate(self, method="window", year1=None):
         """
         Calculate aggregate values for an economy.
         Also overwrites existing values.
+        Workers are weighted by cohort size. method="window" sums the
+        cohorts working in each year from prefix sums over birth years;
+        "loop" visits every person and leaves ages set for end_time, and
+        needs the two default types.
+        Only years from year1, if given, are rebuilt.
         """
-        for t in range(self._start_time, self._end_time + 1):
+        if year1 is None:
+            year1 = self._start_time
+        if method == "window":
+            self._build_aggregate_window(year1)
+            return
+        elif method != "loop":
+            raise ValueError("Unknown method: %s" % method)
+        elif [skill.label for skill in self._types] != ["low", "high"]:
+            raise ValueError("method='loop' needs the low and high types")
+
+        for t in range(year1, self._end_time + 1):
             H = 0
             L = 0
             H_tilde = 0
             L_tilde = 0
-            for generation, individuals in self._indiv_dict.iteritems():
+            for generation, individuals in self._indiv_dict.items():
                 low_skill, high_skill = individuals
                 for person in [low_skill, high_skill]:
                     person.update_age(t - generation)
-                    if person.get_type = "low":
-                        L += person.work()
-                        L_tilde += person.work() * (1 - person.get_gamma())
-                    elif person.get_type = "high":
-                        H += person.work()
-                        H_tilde += person.work() * (1 - person.get_gamma())
+                    if person.get_type() == "low":
+                        L += person.work() * person.get_size()
+                        L_tilde += person.work() * person.get_size() * (1 - person.get_gamma())
+                    elif person.get_type() == "high":
+                        H += person.work() * person.get_size()
+                        H_tilde += person.work() * person.get_size() * (1 - person.get_gamma())
                     else:
                         assert False, "No Person Type"
             self._pop_dict[t] = (L, H)
             self._supply_dict[t] = (L_tilde, H_tilde)
 
+    def _build_aggregate_window(self, year1):
+        """
+        build_aggregate without visiting people.
+        Cohorts born between t - age_max and t - age_middle work in year t,
+        so each year is a difference of cumulative sums over birth years.
+        """
+        table = self._indiv_dict
+        years = np.arange(year1, self._end_time + 1)
+        birth = table.get_birth()
+        first = birth[0] if len(birth) else 0
+        count = len(birth)
+        present = table.get_present()[:, np.newaxis]
+        size = table.get_size() * present
+        effective = size * (1 - table.get_gamma())
+        labor = self._get_labor()
+        middle = table.get_param("age_middle")
+        top = table.get_param("age_max")
+        assert ((labor >= 0) | ~present).all(), "No Person Type"
+
+        totals = []
+        for index in range(len(LABOR)):
+            workers = np.zeros(len(years))
+            supply = np.zeros(len(years))
+            group = (labor == index) & present
+            for age_middle, age_max in set(zip(middle[group], top[group])):
+                rows = group & (middle == age_middle) & (top == age_max)
+                lo = np.clip(years - age_max - first, 0, count)
+                hi = np.clip(years - age_middle - first + 1, lo, count)
+                for out, values in ((workers, size), (supply, effective)):
+                    cum = np.concatenate(([0], np.cumsum((values * rows).sum(axis=1))))
+                    out += cum[hi] - cum[lo]
+            totals.append((workers, supply))
+
+        (L, L_tilde), (H, H_tilde) = totals
+        for i, t in enumerate(years.tolist()):
+            self._pop_dict[t] = (float(L[i]), float(H[i]))
+            self._supply_dict[t] = (float(L_tilde[i]), float(H_tilde[i]))
+
+
+
+    def _get_labor(self):
+        """
+        Labor of each row and slot of the table, from its skill label:
+        0 for low, 1 for high and -1 for labels of no known type.
+        """
+        skill = self._indiv_dict.get_skill()
+        labor = np.full(skill.shape, -1, dtype=int)
+        for label, index in self._labor_of.items():
+            labor[skill == label] = index
+        return labor
 
+    def get_types(self):
+        return self._types
 
     def tech_growth(self, ratio):
         """
         Technology growth rate calculation
         """
-        gpt = B * ratio ** delta
+        gpt = self._bigB * ratio ** self._delta
         return self._eta_a * gpt, self._eta_m * gpt
 
+    def tech_path(self, ratio, Am, Aa):
+        """
+        Technology levels along a path of H_tilde / L_tilde ratios.
+        Am and Aa are the levels in the first year, and each year grows
+        them by tech_growth of the ratio the year before. The running
+        product starts from the first level, so it matches growing the
+        levels one year at a time.
+        :return: arrays of Am and Aa, one per ratio.
+        """
+        growth_a, growth_m = self.tech_growth(np.array(ratio, dtype=float, ndmin=1)[:-1])
+        Am = np.cumprod(np.concatenate(([Am], 1 + growth_m)))
+        Aa = np.cumprod(np.concatenate(([Aa], 1 + growth_a)))
+        return Am, Aa
 
-
-    def build_firms(self, year1, year2):
+    def make_firm_path(self, year1, pop, supply, Am, Aa):
+        """
+        FirmPath from year1 for rows of (L, H) and (L_tilde, H_tilde) by
+        year, as build_firms makes it, without storing anything.
+        Raises ValueError if some sector would get no labor.
+        """
+        L, H = np.array(pop, dtype=float).reshape(-1, 2).T
+        L_tilde, H_tilde = np.array(supply, dtype=float).reshape(-1, 2).T
+        # Technology is only grown through years with both kinds of labor.
+        feasible = (H_tilde > 0) & (L_tilde > 0)
+        years = len(feasible) if feasible.all() else int(np.argmin(feasible))
+        if years > 0:
+            Am, Aa = self.tech_path(H_tilde[:years] / L_tilde[:years], Am, Aa)
+            Lm = self.labor_allocation(L_tilde[:years], L[:years] + H[:years], Aa, self._params.ctilde,
+                                       self._params.beta, self._params.alpha, self._epsilon)
+            feasible[:years] &= (0 < Lm) & (Lm < L_tilde[:years])
+        if not feasible.all():
+            raise ValueError("No feasible labor allocation in %s" % (year1 + int(np.argmin(feasible))))
+        return FirmPath(H_tilde, Lm, L_tilde - Lm, Am, Aa, self._epsilon, year1)
+
+    def build_firms(self, year1, year2, Am, Aa):
         """
         populates firms dictionary between two given years.
+        Am and Aa are tech levels in year1. Each following year grows
+        them by tech_growth of the previous year's H_tilde / L_tilde.
+        Raises ValueError if some sector would get no labor.
+        Every year is priced at once: the firms are kept in a FirmPath,
+        which is updated in place when it already covers the years.
+        Firms stored for other years are moved into the path, unless
+        their years leave a gap or they have another epsilon, in which
+        case Firm objects are added.
         """
-
-        for t in range(year1, year2 + 1):
-            new_Aa = self.tech_growth()
-
+        if year2 < year1:
+            return
+        years = range(year1, year2 + 1)
+        inputs = self.make_firm_path(year1, [self._pop_dict[t] for t in years],
+                                     [self._supply_dict[t] for t in years], Am, Aa).get_input_path()
+
+        firms = self._firm_dict
+        if isinstance(firms, FirmPath) and year1 in firms and year2 in firms:
+            firms.update_years(year1, *inputs)
+            return
+        kept = sorted(t for t in firms if not year1 <= t <= year2)
+        span = range(min(kept + [year1]), max(kept + [year2]) + 1)
+        if len(kept) + len(years) < len(span) or any(firms[t].get_epsilon() != self._epsilon for t in kept):
+            for i, t in enumerate(years):
+                self.add_firm(Firm(*[float(x[i]) for x in inputs] + [self._epsilon]), t)
+            return
+        columns = np.empty((5, len(span)))
+        for t in kept:
+            columns[:, t - span[0]] = firms[t].get_labor() + firms[t].get_tech()
+        columns[:, year1 - span[0]:year2 - span[0] + 1] = inputs
+        self.add_firm_path(FirmPath(*columns, epsilon=self._epsilon, start_year=span[0]))
+
+
+    def simulate(self, Am, Aa, fertility, year2=None):
+        """
+        Simulate forward from start_time, yielding one dictionary of
+        aggregates, prices and output per year, up to year2 or forever.
+        fertility(year) gives the (skill type, child type) array of the
+        cohort born in year; an array is used for every year. Cohorts
+        born before start_time come from the table, later ones are sized
+        from their parents. Only the cohorts still needed and the current
+        technology are kept, so memory does not grow with the horizon.
+        Nothing is stored in the economy.
+        """
+        if not callable(fertility):
+            fixed = np.array(fertility, dtype=float)
+            fertility = lambda year: fixed
+        params = self._params
+        taus = np.array([skill.tau for skill in self._types], dtype=float)
+        low = self._child_labor == 0
+        high = ~low
+        table = self._indiv_dict
+        n = table.get_fertility()
+        size = table.get_size()
+        tau = table.get_tau()
+        # (size, fertility, child costs) by skill type, for each birth year
+        window = collections.deque(maxlen=max(params.age_max, AGE_BIRTH) + 1)
+        for generation in range(self._start_time - window.maxlen + 1, self._start_time):
+            i = table.get_rows(generation, generation).start
+            window.append((size[i], n[i], tau[i]))
+
+        t = self._start_time
+        while year2 is None or t <= year2:
+            parent_size, parent_n, parent_tau = window[-AGE_BIRTH]
+            window.append(((parent_size[:, np.newaxis] * parent_n).sum(axis=0),
+                           np.array(fertility(t), dtype=float), np.tile(taus, (len(taus), 1))))
+
+            L, H, L_tilde, H_tilde = 0., 0., 0., 0.
+            for age in range(params.age_middle, params.age_max + 1):
+                cohort_size, cohort_n, cohort_tau = window[-1 - age]
+                effective = cohort_size * (1 - (cohort_n * cohort_tau).sum(axis=1))
+                L, H = L + cohort_size[low].sum(), H + cohort_size[high].sum()
+                L_tilde, H_tilde = L_tilde + effective[low].sum(), H_tilde + effective[high].sum()
+
+            Lm = self.labor_allocation(L_tilde, L + H, Aa, params.ctilde, params.beta, params.alpha, self._epsilon)
+            if not (H_tilde > 0 and 0 < Lm < L_tilde):
+                raise ValueError("No feasible labor allocation in %s" % t)
+            firm = Firm(H_tilde, Lm, L_tilde - Lm, Am, Aa, self._epsilon)
+            ws, wu, pa = firm.get_prices()
+            Yt, Ym, Ya = firm.get_output()
+            yield {"year": t, "L": float(L), "H": float(H), "L_tilde": float(L_tilde), "H_tilde": float(H_tilde),
+                   "ws": ws, "wu": wu, "pa": pa, "Yt": Yt, "Ym": Ym, "Ya": Ya, "Am": Am, "Aa": Aa}
+
+            growth_a, growth_m = self.tech_growth(H_tilde / L_tilde)
+            Aa = Aa * (1 + growth_a)
+            Am = Am * (1 + growth_m)
+            t += 1
 
     def update_sizes(self, year1, year2):
         """
         update all sizes.
+        The cohort born in t is the parents' sizes times their fertility
+        matrix, so each cohort is an earlier size times a product of
+        fertility matrices. Cohorts AGE_BIRTH years apart form a chain
+        started by the last size before year1, and all its products come
+        from one call to _prefix_products.
         """
-        for t in range(year1, year2  + 1):
-            low_skill, high_skill = self._indiv_dict[t]
-            for person in [low_skill, high_skill]:
-                p_low, p_high = self._indiv_dict[t - AGE_BIRTH]
-                if person.get_type() = "low"
-                    new_size = p_low.get_size() * p_low.get_n()[0] + p_high.get_size() * p_high.get_n()[0]
-                elif person.get_type() = "high":
-                    new_size = p_low.get_size() * p_low.get_n()[1] + p_high.get_size() * p_high.get_n()[1]
-                person.update_size(new_size)
+        table = self._indiv_dict
+        rows = table.get_rows(year1 - AGE_BIRTH, year2)
+        n = table.get_fertility()[rows]
+        size = table.get_size()[rows]
+        for chain in range(min(AGE_BIRTH, year2 - year1 + 1)):
+            # Rows chain, chain + AGE_BIRTH, ... are the seed and its parents.
+            parents = n[chain:-AGE_BIRTH:AGE_BIRTH]
+            size[chain + AGE_BIRTH::AGE_BIRTH] = np.matmul(size[chain], _prefix_products(parents))
 
 
+    def refresh(self, Am, Aa):
+        """
+        Bring sizes, aggregates and firms up to date with fertility changed
+        since the last refresh, recomputing only the years it reaches.
+        A change in cohort g resizes its descendants from g + AGE_BIRTH and
+        changes labor from g + age_middle; technology then carries the
+        change to every later firm. Am and Aa are used when the first
+        firm is rebuilt, and later years start from the stored firm.
+        :return: number of years recomputed.
+        """
+        start, end = self._start_time, self._end_time
+        if self._dirty > end:
+            self._refreshed.append(0)
+            return 0
+        self.update_sizes(int(max(start, self._dirty + AGE_BIRTH)), end)
+        first = int(max(start, self._dirty + self._indiv_dict.get_param("age_middle").min()))
+        if first > end:
+            self._dirty = float("inf")
+            self._refreshed.append(0)
+            return 0
+        if first > start and first in self._firm_dict:
+            Am, Aa = self._firm_dict[first].get_tech()
+        else:
+            first = start
+        self.build_aggregate(year1=first)
+        self.build_firms(first, end, Am, Aa)
+        self._dirty = float("inf")
+        self._refreshed.append(end - first + 1)
+        return end - first + 1
+
+    def get_refreshed(self):
+        """
+        Return the number of years recomputed by each refresh.
+        """
+        return self._refreshed
+
+    def get_horizon(self):
+        return self._start_time, self._end_time
+
+    def save(self, path, solver=None):
+        """
+        Write the economy to an .npz file of columns, with the big_loop
+        state solver if given. The file at path is only replaced once the
+        new one is complete, so a crash leaves the last good checkpoint.
+        """
+        arrays = self.get_arrays(solver)
+        temp = path + ".tmp"
+        with open(temp, "wb") as out:
+            np.savez_compressed(out, **arrays)
+        getattr(os, "replace", os.rename)(temp, path)
+
+    def get_arrays(self, solver=None):
+        """
+        Return the economy, and the big_loop state solver if given, as a
+        dictionary of arrays that economy_from_arrays reads back.
+        """
+        arrays = self._indiv_dict.get_arrays()
+        arrays["economy"] = np.array([self._start_time, self._end_time, self._bigB, self._delta, self._eta_m,
+                                      self._eta_a, self._omega_start, self._omega_end, self._epsilon], dtype=float)
+        arrays["params"] = np.array(self._params, dtype=float)
+        arrays["dirty"] = np.array(self._dirty, dtype=float)
+        arrays["type_label"] = np.array([skill.label for skill in self._types], dtype=str)
+        arrays["type_labor"] = np.array([skill.labor for skill in self._types], dtype=str)
+        arrays["type_tau"] = np.array([skill.tau for skill in self._types], dtype=float)
+        years = sorted(self._pop_dict)
+        arrays["aggregate_years"] = np.array(years, dtype=int)
+        arrays["pop"] = np.array([self._pop_dict[t] for t in years], dtype=float).reshape(-1, 2)
+        arrays["supply"] = np.array([self._supply_dict[t] for t in years], dtype=float).reshape(-1, 2)
+
+        firms = self._firm_dict
+        years = sorted(firms)
+        arrays["firm_path"] = np.array(isinstance(firms, FirmPath))
+        arrays["firm_years"] = np.array(years, dtype=int)
+        if isinstance(firms, FirmPath):
+            arrays["firm_inputs"] = np.column_stack(firms.get_input_path()).reshape(-1, 5)
+            arrays["firm_epsilon"] = np.array([firms.get_epsilon()] * len(years), dtype=float)
+        else:
+            arrays["firm_inputs"] = np.array([firms[t].get_labor() + firms[t].get_tech() for t in years],
+                                             dtype=float).reshape(-1, 5)
+            arrays["firm_epsilon"] = np.array([firms[t].get_epsilon() for t in years], dtype=float)
+
+        if solver is not None:
+            arrays["solver_scheme"] = np.array(solver["scheme"], dtype=str)
+            arrays["solver_iteration"] = np.array(solver["iteration"])
+            arrays["solver_x"] = solver["x"]
+            arrays["solver_history"] = np.array(solver["history"], dtype=float)
+            arrays["solver_exact"] = np.array(solver.get("exact", False))
+            for key, value in solver["updater"].items():
+                arrays["updater_" + key] = value
+        return arrays
+
+    def get_params(self):
+        return self._params
+
+    def get_decision_years(self):
+        """
+        First and last birth years whose choices can be solved.
+        Their middle-age years and omega window must have firms, which
+        exist from start_time to end_time.
+        """
+        params = self._indiv_dict[self._start_time][0].get_params()
+        year1 = self._start_time - min(params.age_middle, self._omega_start)
+        year2 = self._end_time - max(params.age_old - 1, self._omega_end)
+        year1 = max(year1, min(self._indiv_dict))
+        return year1, year2
+
+    def get_fertility(self, year1, year2):
+        """
+        Return fertility of cohorts born between two given years,
+        as an array of (year, skill type, child type). With the default
+        types the last axis is (nu, ns).
+        """
+        return self._indiv_dict.get_fertility()[self._indiv_dict.get_rows(year1, year2)].copy()
+
+    def set_fertility(self, year1, year2, n, tol=0):
+        """
+        Set fertility of cohorts born between two given years.
+        Cohorts whose fertility changes by no more than tol keep their old
+        values; the first changed cohort is marked dirty for refresh.
+        """
+        old = self._indiv_dict.get_fertility()[self._indiv_dict.get_rows(year1, year2)]
+        changed = ~(np.abs(n - old).reshape(len(old), -1).max(axis=1) <= tol)
+        if changed.any():
+            old[changed] = n[changed]
+            self.mark_dirty(year1 + int(np.flatnonzero(changed)[0]))
+
+    def make_decisions(self, year1, year2, tolw=TOLW, method="newton", executor=None, chunksize=CHUNKSIZE,
+                       cache=None):
+        """
+        Optimal fertility of cohorts born between two given years.
+        Each person is solved at middle age against their middle-age wages
+        and prices and the omega of their birth year, keeping the ratio of
+        their current choice. Returns an array shaped like get_fertility;
+        nothing is stored.
+        With method "newton" or "table" and no executor or cache, or with
+        other types than low and high, every cohort and type is solved at
+        once by _decide. Otherwise people are solved one by one through
+        Individual.maximize_n, so the result is the same with or without
+        an executor or cache: with a concurrent.futures executor, chunks
+        of chunksize solves run in parallel, each sent as a tuple of plain
+        numbers, and a HouseholdCache is checked before anything is solved
+        or sent.
+        """
+        default = [skill.label for skill in self._types] == ["low", "high"]
+        if executor is None and cache is None and (method in ("newton", "table") or not default):
+            return self._decide(year1, year2, tolw, method)
+        if not default:
+            raise ValueError("An executor or cache needs the low and high types")
+
+        tasks = []
+        for generation in range(year1, year2 + 1):
+            omegau, omegas = self.get_omega(generation)
+            for person in self._indiv_dict[generation]:
+                params = person.get_params()
+                prices = [self._firm_dict[t].get_prices()
+                          for t in range(generation + params.age_middle, generation + params.age_old)]
+                if person.get_type() == "low":
+                    wages = tuple(wu for ws, wu, pa in prices)
+                elif person.get_type() == "high":
+                    wages = tuple(ws for ws, wu, pa in prices)
+                else:
+                    assert False, "No Person Type"
+                nu, ns = person.get_n()
+                last_ratio = ns / nu if nu > 0 else 1
+                tasks.append((person.get_type(), tuple(params), wages, tuple(pa for ws, wu, pa in prices),
+                              omegau, omegas, last_ratio, tolw, method))
+
+        if executor is None:
+            results = _solve_households(tasks, cache)
+        else:
+            results = [None] * len(tasks)
+            if cache is not None:
+                keys = [cache.key(params, params[5], wages, prices, omegau, omegas, last_ratio,
+                                  tolw, NVECTOR, method, XTOL)
+                        for skill, params, wages, prices, omegau, omegas, last_ratio, tolw, method in tasks]
+                results = [cache.get(key) for key in keys]
+            todo = [i for i, n in enumerate(results) if n is None]
+            chunks = [[tasks[i] for i in todo[j:j + chunksize]] for j in range(0, len(todo), chunksize)]
+            solved = [n for chunk in executor.map(_solve_households, chunks) for n in chunk]
+            for i, n in zip(todo, solved):
+                results[i] = n
+                if cache is not None:
+                    cache.put(keys[i], n)
+        return np.array(results, dtype=float).reshape(year2 - year1 + 1, 2, 2)
+
+    def _decide(self, year1, year2, tolw, method):
+        """
+        make_decisions for every cohort and type at once.
+        Child types are ranked by omega per unit of child time. With
+        omega and tau relative to type 0, type j is used if
+        omega_k tau_j - omega_j tau_k is within tolw for the best type k,
+        which with two types is the test of Individual.child_mix, and the
+        ratios of the current choice are kept among those used. Along
+        that direction the problem has one unknown, with the direction's
+        total time cost and omega. method="newton" solves it for all
+        households with _newton_batch and "table" looks them up in the
+        PolicyTable of each alpha, beta and number of working periods;
+        other methods, which make_decisions only sends here for other
+        types than low and high, solve person by person with
+        Individual.maximize_n.
+        """
+        table = self._indiv_dict
+        rows = table.get_rows(year1, year2)
+        labor = self._get_labor()[rows]
+        assert (labor >= 0).all(), "No Person Type"
+        omega = np.array([self.get_omega(g) for g in range(year1, year2 + 1)])[:, np.newaxis, self._child_labor]
+        taus = table.get_tau()[rows]
+        last = table.get_fertility()[rows]
+
+        relative_omega, relative_tau = omega / omega[..., :1], taus / taus[..., :1]
+        best = np.argmax(omega / taus, axis=-1)[..., np.newaxis]
+        chosen = (np.take_along_axis(relative_omega, best, axis=-1) * relative_tau -
+                  relative_omega * np.take_along_axis(relative_tau, best, axis=-1)) <= tolw
+        base = np.take_along_axis(last, np.argmax(chosen, axis=-1)[..., np.newaxis], axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            direction = np.where(chosen, np.where(base > 0, last / base, 1.), 0.)
+        cost = (taus * direction).sum(axis=-1)
+        omega = (omega * direction).sum(axis=-1)
+
+        params = dict((name, table.get_param(name)[rows]) for name in HouseholdParams._fields)
+        generation = np.arange(year1, year2 + 1)[:, np.newaxis] + np.zeros(labor.shape, dtype=int)
+        years = range(year1 + int(params["age_middle"].min()), year2 + int(params["age_old"].max()))
+        prices = np.array([self._firm_dict[t].get_prices() for t in years]).reshape(-1, 3)
+        n = np.zeros(labor.shape)
+        for age_middle, age_old in set(zip(params["age_middle"].ravel(), params["age_old"].ravel())):
+            group = (params["age_middle"] == age_middle) & (params["age_old"] == age_old)
+            index = generation[group][:, np.newaxis] + np.arange(age_middle, age_old) - years[0]
+            price = prices[index, 2]
+            wage = np.where(labor[group][:, np.newaxis] == 1, prices[index, 0], prices[index, 1])
+            if method == "newton":
+                n[group] = _newton_batch(params["alpha"][group], params["beta"][group], params["ctilde"][group],
+                                         cost[group], omega[group], wage, price, XTOL)
+                continue
+            if method == "table":
+                solved = np.zeros(len(wage))
+                alpha, beta = params["alpha"][group], params["beta"][group]
+                for pair in set(zip(alpha.tolist(), beta.tolist())):
+                    rows = (alpha == pair[0]) & (beta == pair[1])
+                    policy = get_policy_table(pair[0], pair[1], age_old - age_middle)
+                    solved[rows] = policy.solve(params["ctilde"][group][rows], cost[group][rows],
+                                                omega[group][rows], wage[rows], price[rows])
+                n[group] = solved
+                continue
+            solved = []
+            for i, values in enumerate(zip(*[params[name][group].tolist() for name in HouseholdParams._fields])):
+                person = Individual("", params=_make_params(values)._replace(tau_u=cost[group][i],
+                                                                            tau_s=cost[group][i]))
+                person.update_age(person.get_params().age_middle)
+                solved.append(person.maximize_n(wage[i].tolist(), price[i].tolist(), omega[group][i], 0., 0.,
+                                                tolw, method=method)[0])
+            n[group] = solved
+
+        final = n[..., np.newaxis] * direction
+        assert (final >= 0).all() and (final.max(axis=-1) > 0).all()
+        return final
+
     def get_pop(self, year):
         """
         Return aggregate values.
@@ -384,42 +1947,430 @@ class Economy:
     def get_omega(self, year):
         """
         Returns omega values for each year.
+        Sums wu and ws over years omega_start to omega_end ahead.
+        """
+        self._update_omega_index()
+        first = self._omega_first
+        cum_u, cum_s, cum_missing = self._omega_cum
+        if first is not None:
+            lo = year + self._omega_start - first
+            hi = year + self._omega_end - first + 1
+        if first is None or lo < 0 or hi >= len(cum_u) or cum_missing[hi] != cum_missing[lo]:
+            missing = [t for t in range(year + self._omega_start, year + self._omega_end + 1)
+                       if t not in self._firm_dict]
+            raise KeyError(missing[0])
+        return float(cum_u[hi] - cum_u[lo]), float(cum_s[hi] - cum_s[lo])
+
+    def _update_omega_index(self):
         """
-        out_u = 0
-        out_s = 0
-        for t in range(year + 20, year + 40 + 1):
-            s, u, p = self._firm_dict[t].get_prices()
-            out_u += u
-            out_s += s
-        return out_u, out_s
+        Rebuild the prefix sums behind get_omega from the first changed year.
+        """
+        if self._omega_dirty == float("inf"):
+            return
+        firms = self._firm_dict
+        if len(firms) == 0:
+            self._omega_first = None
+            self._omega_cum = (np.zeros(1), np.zeros(1), np.zeros(1))
+            self._omega_dirty = float("inf")
+            return
+        first, last = min(firms), max(firms)
+        if self._omega_first != first or self._omega_dirty < first:
+            start = first
+        else:
+            indexed_last = first + len(self._omega_cum[0]) - 2
+            start = int(min(self._omega_dirty, indexed_last + 1))
+        keep = start - first
+
+        if isinstance(firms, FirmPath):
+            ws, wu, pa = firms.get_price_path()
+            wu, ws = wu[keep:], ws[keep:]
+            missing = np.zeros(len(wu))
+        else:
+            wu = np.zeros(last - start + 1)
+            ws = np.zeros(last - start + 1)
+            missing = np.zeros(last - start + 1)
+            for t in range(start, last + 1):
+                if t in firms:
+                    ws[t - start], wu[t - start], p = firms[t].get_prices()
+                else:
+                    missing[t - start] = 1
+
+        cum = []
+        for i, values in enumerate((wu, ws, missing)):
+            column = np.zeros(last - first + 2)
+            if keep > 0:
+                column[:keep + 1] = self._omega_cum[i][:keep + 1]
+            column[keep + 1:] = column[keep] + np.cumsum(values)
+            cum.append(column)
+        self._omega_first = first
+        self._omega_cum = tuple(cum)
+        self._omega_dirty = float("inf")
+
+
+def load_economy(path):
+    """
+    Read an economy written by Economy.save, without solving anything.
+    :return: economy and big_loop state to resume from, or None.
+    """
+    with np.load(path, allow_pickle=False) as saved:
+        arrays = dict(saved.items())
+    return economy_from_arrays(arrays)
 
 
-def initial(H_m, L_m, L_a, N, Y_a, Y_m):
+def economy_from_arrays(arrays):
+    """
+    Economy and big_loop state from a mapping of Economy.get_arrays.
+    :return: economy and big_loop state to resume from, or None.
+    """
+    start, end, bigB, delta, eta_m, eta_a, omega_start, omega_end, epsilon = arrays["economy"].tolist()
+    types = [SkillType(str(label), str(labor), tau) for label, labor, tau in
+             zip(arrays["type_label"].tolist(), arrays["type_labor"].tolist(), arrays["type_tau"].tolist())]
+    economy = Economy(int(start), int(end), bigB, delta, eta_m, eta_a, int(omega_start), int(omega_end),
+                      epsilon, _make_params(arrays["params"]), types)
+    economy.get_indivs().set_arrays(arrays)
+    for t, pop, supply in zip(arrays["aggregate_years"].tolist(), arrays["pop"].tolist(),
+                              arrays["supply"].tolist()):
+        economy._pop_dict[t] = tuple(pop)
+        economy._supply_dict[t] = tuple(supply)
+
+    years = arrays["firm_years"].tolist()
+    if bool(arrays["firm_path"]):
+        inputs = arrays["firm_inputs"].T
+        economy.add_firm_path(FirmPath(*inputs, epsilon=float(arrays["firm_epsilon"][0]), start_year=years[0]))
+    else:
+        for t, inputs, firm_epsilon in zip(years, arrays["firm_inputs"].tolist(), arrays["firm_epsilon"].tolist()):
+            economy.add_firm(Firm(*inputs, epsilon=firm_epsilon), t)
+    if "dirty" in arrays:
+        economy._dirty = float(arrays["dirty"])
+
+    solver = None
+    if "solver_x" in arrays:
+        solver = {"scheme": str(arrays["solver_scheme"]), "iteration": int(arrays["solver_iteration"]),
+                  "x": arrays["solver_x"], "history": arrays["solver_history"].tolist(),
+                  "exact": "solver_exact" in arrays and bool(arrays["solver_exact"]),
+                  "updater": dict((key[len("updater_"):], value) for key, value in arrays.items()
+                                  if key.startswith("updater_"))}
+    return economy, solver
+
+
+def initial(H_m, L_m, L_a, N, Y_a, Y_m, ctilde=CTILDE, beta=BETA, alpha=ALPHA):
     """
     Algorithm for determining initial prices and technology levels.
+    Inputs are observed labor by sector, population and output by
+    sector; each may be an array with one target per element (countries
+    or base years), and every target is calibrated at once.
+    Ya = Aa La gives Aa, inverting labor_allocation at that Aa gives
+    epsilon, and Ym = Am Hm^epsilon Lm^(1 - epsilon) then gives Am.
+    Raises ValueError if some target has no epsilon in (0, 1).
+    :return: epsilon, Am, Aa and prices ws, wu, pa, as arrays.
+    """
+    H_m, L_m, L_a, N, Y_a, Y_m = np.broadcast_arrays(*[np.array(x, dtype=float, ndmin=1)
+                                                       for x in (H_m, L_m, L_a, N, Y_a, Y_m)])
+    Aa = Y_a / L_a
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac = L_m / (L_m + L_a - (N / Aa) * ctilde)
+        epsilon = 1 - (alpha / beta) * frac / (1 - frac)
+    feasible = (H_m > 0) & (L_m > 0) & (L_a > 0) & (0 < epsilon) & (epsilon < 1)
+    if not feasible.all():
+        raise ValueError("No epsilon in (0, 1) for target %s" % int(np.argmin(feasible.ravel())))
+    Am = Y_m / (H_m ** epsilon * L_m ** (1 - epsilon))
+    ws, wu, pa = Firm(H_m, L_m, L_a, Am, Aa, epsilon).get_prices()
+    return epsilon, Am, Aa, ws, wu, pa
+
+
+def _newton_batch(alpha, beta, ctilde, cost, omega, wage, price, xtol):
+    """
+    Individual._newton_n for arrays of households along their directions.
+    Parameters, cost and omega are arrays over households; wage and
+    price have a further axis over periods. Newton steps run together
+    until every household is within xtol.
     """
-    pass
+    roots = (wage - price * ctilde[:, np.newaxis]) / (wage * cost[:, np.newaxis])
+    return _newton_roots(alpha, beta, roots, xtol, omega <= 0)
 
 
-def big_loop():
+def _newton_roots(alpha, beta, roots, xtol, zero=False):
     """
-    :return:
+    _newton_batch given each household's roots m_i, where income in a
+    period hits zero. Households in zero, or with a root that is not
+    positive, have no children.
     """
+    top = roots.min(axis=1)
+    kids = roots.shape[1] * (1 - alpha - beta)
+    goods = alpha + beta
+    n = (1 - alpha - beta) * top
+    zero = (top <= 0) | zero
+    result = np.where(zero, 0., n)
+    active = ~zero & (roots.max(axis=1) - top > xtol)
+    lo, hi = np.zeros(len(n)), top.copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for _ in range(100):
+            if not active.any():
+                break
+            gap = roots - n[:, np.newaxis]
+            slope = kids / n - goods * (1 / gap).sum(axis=1)
+            lo = np.where(active & (slope > 0), n, lo)
+            hi = np.where(active & ~(slope > 0), n, hi)
+            curve = -kids / n ** 2 - goods * (1 / gap ** 2).sum(axis=1)
+            step = n - slope / curve
+            step = np.where((lo < step) & (step < hi), step, (lo + hi) / 2)
+            finished = active & ((np.abs(step - n) <= xtol) | (hi - lo <= xtol))
+            result = np.where(finished, step, result)
+            n = np.where(active, step, n)
+            active &= ~finished
+    return np.where(active, n, result)
+
+
+def _prefix_products(matrices):
+    """
+    Running products m[0], m[0] m[1], ... of a stack of matrices.
+    Doubling the span each pass takes log2(len) batched products.
+    """
+    out = np.array(matrices, dtype=float)
+    span = 1
+    while span < len(out):
+        out[span:] = np.matmul(out[:-span], out[span:])
+        span *= 2
+    return out
 
-    # initialize economy.
 
-    # difference = 1 million pesos
+def _solve_households(tasks, cache=None):
+    """
+    Solve a list of households described by make_decisions tuples.
+    Module level so that process pools can pickle it.
+    """
+    results = []
+    for skill, params, wages, prices, omegau, omegas, last_ratio, tolw, method in tasks:
+        person = Individual(skill, *params)
+        person.update_age(person.get_params().age_middle)
+        results.append(person.maximize_n(wages, prices, omegau, omegas, last_ratio, tolw,
+                                         method=method, cache=cache))
+    return results
 
-    # while difference > blah blah blah
 
-        # update sizes
+class DampedUpdate:
+    """
+    Next guess x + damping * (F(x) - x).
+    The step is halved whenever the largest residual rises, and grows
+    by a quarter, up to damping, whenever it falls.
+    """
 
-        # update aggregates
+    def __init__(self, damping=.5, memory=0):
+        self._top = damping
+        self._damping = damping
+        self._last = float("inf")
 
-        # make optimal decisions
+    def update(self, x, fx):
+        residual = fx - x
+        size = float(np.abs(residual).max())
+        if size > self._last:
+            self._damping = self._damping / 2
+        else:
+            self._damping = min(self._top, self._damping * 1.25)
+        self._last = size
+        return x + self._damping * residual
 
-        # generate new guesses
+    def get_state(self):
+        """
+        Return the current damping and last residual, for saving.
+        """
+        return {"damping": np.array(self._damping), "last": np.array(self._last)}
 
-        # calc difference
+    def set_state(self, state):
+        self._damping = float(state["damping"])
+        self._last = float(state["last"])
 
-    pass
+
+class AndersonUpdate:
+    """
+    Anderson acceleration over the last memory iterates.
+    Mixes the damped step with the combination of past steps that best
+    cancels the current residual F(x) - x.
+    """
+
+    def __init__(self, damping=.5, memory=5):
+        self._damping = damping
+        self._memory = memory
+        self._xs = []
+        self._rs = []
+
+    def update(self, x, fx):
+        residual = fx - x
+        self._xs.append(x)
+        self._rs.append(residual)
+        if len(self._xs) > self._memory + 1:
+            self._xs.pop(0)
+            self._rs.pop(0)
+        if len(self._xs) == 1:
+            return x + self._damping * residual
+        dx = np.column_stack([b - a for a, b in zip(self._xs[:-1], self._xs[1:])])
+        dr = np.column_stack([b - a for a, b in zip(self._rs[:-1], self._rs[1:])])
+        gamma = np.linalg.lstsq(dr, residual, rcond=None)[0]
+        return x - dx.dot(gamma) + self._damping * (residual - dr.dot(gamma))
+
+    def get_state(self):
+        """
+        Return past iterates and residuals as arrays, for saving.
+        """
+        return {"xs": np.array(self._xs, dtype=float), "rs": np.array(self._rs, dtype=float)}
+
+    def set_state(self, state):
+        self._xs = list(state["xs"])
+        self._rs = list(state["rs"])
+
+
+class BroydenUpdate:
+    """
+    Broyden's method on F(x) - x = 0.
+    The inverse Jacobian starts at -damping (a damped step) and keeps the
+    last memory rank-one secant updates.
+    """
+
+    def __init__(self, damping=.5, memory=5):
+        self._damping = damping
+        self._memory = memory
+        self._us = []
+        self._vs = []
+        self._last = None
+
+    def _inverse(self, r):
+        out = -self._damping * r
+        for u, v in zip(self._us, self._vs):
+            out = out + u * v.dot(r)
+        return out
+
+    def update(self, x, fx):
+        residual = fx - x
+        if self._last is not None:
+            dx = x - self._last[0]
+            dr = residual - self._last[1]
+            scale = dr.dot(dr)
+            if scale > 0:
+                self._us.append((dx - self._inverse(dr)) / scale)
+                self._vs.append(dr)
+            if len(self._us) > self._memory:
+                self._us.pop(0)
+                self._vs.pop(0)
+        self._last = (x, residual)
+        return x - self._inverse(residual)
+
+    def get_state(self):
+        """
+        Return secant updates and the last step as arrays, for saving.
+        """
+        last = [] if self._last is None else self._last
+        return {"us": np.array(self._us, dtype=float), "vs": np.array(self._vs, dtype=float),
+                "last": np.array(last, dtype=float)}
+
+    def set_state(self, state):
+        self._us = list(state["us"])
+        self._vs = list(state["vs"])
+        self._last = tuple(state["last"]) if len(state["last"]) else None
+
+
+UPDATES = {"damped": DampedUpdate, "anderson": AndersonUpdate, "broyden": BroydenUpdate}
+
+
+def big_loop(economy, Am, Aa, scheme="anderson", damping=.5, memory=5, tol=1e-6, max_iter=100,
+             tolw=TOLW, method="newton", report=None, workers=None, chunksize=CHUNKSIZE, cache=None,
+             checkpoint=None, checkpoint_every=10, resume=None, dirty_tol=None):
+    """
+    Solve for equilibrium fertility.
+    Each iteration updates sizes and aggregates, builds firms starting
+    from Am and Aa, and makes optimal decisions for the cohorts in
+    get_decision_years. The next guess comes from scheme, one of UPDATES.
+    Negative guesses are set to zero. Stops when the largest change in
+    fertility is below tol; report(iteration, residual) is called after
+    every iteration. With workers, household decisions run on a process
+    pool of that size. cache is a HouseholdCache shared by all iterations.
+    With checkpoint, the economy and solver state are saved to that path
+    every checkpoint_every iterations and at the end. resume is the
+    solver state from load_economy; the loop then carries on from it,
+    counting the iterations already done towards max_iter.
+    With dirty_tol, fertility changes of at most dirty_tol are not
+    stored and each iteration uses Economy.refresh, so only years
+    downstream of a changed cohort are rebuilt. Once an iteration is
+    within tol, it is repeated and later ones run with every change
+    stored, so the solve only converges at the stored fertility.
+    :return: converged flag and list of residuals.
+    """
+    executor = None
+    if workers:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(workers)
+    try:
+        return _big_loop(economy, Am, Aa, scheme, damping, memory, tol, max_iter,
+                         tolw, method, report, executor, chunksize, cache, checkpoint, checkpoint_every, resume,
+                         dirty_tol)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _big_loop(economy, Am, Aa, scheme, damping, memory, tol, max_iter,
+              tolw, method, report, executor, chunksize, cache, checkpoint, checkpoint_every, resume,
+              dirty_tol):
+    """
+    Body of big_loop once the executor is chosen.
+    """
+    start, end = economy.get_horizon()
+    year1, year2 = economy.get_decision_years()
+    updater = UPDATES[scheme](damping, memory)
+    n = economy.get_fertility(year1, year2)
+    x = n.ravel()
+    history = []
+    converged = False
+    first = 0
+    if resume is not None:
+        if resume["scheme"] != scheme or resume["x"].shape != x.shape:
+            raise ValueError("Checkpoint does not match this solve")
+        x = resume["x"]
+        history = list(resume["history"])
+        first = resume["iteration"]
+        updater.set_state(resume["updater"])
+    skip = dirty_tol
+    if dirty_tol is not None and resume is not None:
+        # The loaded economy kept its dirty years; only finish exactly if the run had.
+        if resume.get("exact"):
+            skip = 0
+    elif dirty_tol is not None:
+        # Firms built from other technology levels must not be reused.
+        economy.mark_dirty(float("-inf"))
+
+    def save(iteration):
+        economy.save(checkpoint, {"scheme": scheme, "iteration": iteration, "x": x, "history": history,
+                                  "updater": updater.get_state(), "exact": skip == 0})
+
+    for iteration in range(first, max_iter):
+        if _profiler is not None:
+            _profiler.set_iteration(iteration)
+        if dirty_tol is None:
+            economy.set_fertility(year1, year2, x.reshape(n.shape))
+            economy.update_sizes(start, end)
+            economy.build_aggregate()
+            economy.build_firms(start, end, Am, Aa)
+        else:
+            economy.set_fertility(year1, year2, x.reshape(n.shape), skip)
+            economy.refresh(Am, Aa)
+        fx = economy.make_decisions(year1, year2, tolw, method, executor, chunksize, cache).ravel()
+
+        residual = float(np.abs(fx - x).max())
+        history.append(residual)
+        if report is not None:
+            report(iteration, residual)
+        if residual < tol and skip:
+            # Skipped cohorts keep older fertility; from here on store all of x.
+            skip = 0
+            continue
+        if residual < tol:
+            converged = True
+            break
+        x = np.maximum(updater.update(x, fx), 0)
+        if checkpoint is not None and (iteration + 1) % checkpoint_every == 0:
+            save(iteration + 1)
+
+    if _profiler is not None:
+        _profiler.set_iteration(None)
+    if checkpoint is not None:
+        save(len(history))
+    return converged, history
@@ -0,0 +1,147 @@
+"""
+Per-phase timing of the equilibrium loop.
+
+    profiler = profiling.Profiler()
+    with profiler:
+        model.big_loop(economy, Am, Aa)
+    profiler.write_json("phases.json")
+
+While enabled, the phase methods are wrapped on their classes; disabling
+restores the originals, so a disabled profiler costs nothing. Times are
+wall-clock and inclusive, so make_decisions contains maximize_n.
+Solves run in a process pool are not seen.
+"""
+
+__author__ = 'Greg'
+
+import json
+import time
+
+import numpy as np
+
+import model
+
+# Methods timed as phases.
+PHASES = [(model.Economy, "update_sizes"), (model.Economy, "build_aggregate"),
+          (model.Economy, "build_firms"), (model.Economy, "get_omega"),
+          (model.Economy, "make_decisions"), (model.Firm, "__init__"), (model.FirmPath, "update"),
+          (model.FirmPath, "update_years"), (model.Individual, "maximize_n"),
+          (model.Individual, "lifetime_utility"), (model.UtilityPlan, "value"), (model.UtilityPlan, "values")]
+# Phases whose results are utilities of fertility points.
+SCORING = ("UtilityPlan.value", "UtilityPlan.values")
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+class Profiler:
+    """
+    Call counts, wall time, fertility points scored and infeasible (-inf)
+    points, per phase and big_loop iteration. Work outside big_loop is
+    recorded under iteration None.
+    """
+
+    def __init__(self, trace=False):
+        """
+        With trace, every call is also kept for write_trace.
+        """
+        self._trace = trace
+        self._events = []
+        self._stats = {}
+        self._iteration = None
+        self._originals = []
+
+    def enable(self):
+        """
+        Wrap the phase methods. Does nothing if already enabled.
+        """
+        if self._originals:
+            return
+        for cls, name in PHASES:
+            original = cls.__dict__[name]
+            self._originals.append((cls, name, original))
+            setattr(cls, name, self._wrap(cls.__name__ + "." + name, original))
+        model._profiler = self
+
+    def disable(self):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        model._profiler = None
+        self._iteration = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def set_iteration(self, iteration):
+        self._iteration = iteration
+
+    def _wrap(self, phase, original):
+        profiler = self
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            result = original(*args, **kwargs)
+            profiler.record(phase, start, clock(), result)
+            return result
+        wrapper.__name__ = original.__name__
+        wrapper.__doc__ = original.__doc__
+        return wrapper
+
+    def record(self, phase, start, stop, result=None):
+        """
+        Add one call. Utilities returned by UtilityPlan count as scored points.
+        """
+        stats = self._stats.setdefault((self._iteration, phase), [0, 0., 0, 0])
+        stats[0] += 1
+        stats[1] += stop - start
+        if phase in SCORING:
+            result = np.asarray(result)
+            stats[2] += result.size
+            stats[3] += int(np.isneginf(result).sum())
+        if self._trace:
+            self._events.append((phase, self._iteration, start, stop))
+
+    def get_report(self):
+        """
+        Return one dict per phase and iteration.
+        """
+        rows = []
+        for (iteration, phase), (calls, seconds, points, infeasible) in self._stats.items():
+            rows.append({"iteration": iteration, "phase": phase, "calls": calls, "seconds": seconds,
+                         "points": points, "infeasible": infeasible})
+        rows.sort(key=lambda row: (-1 if row["iteration"] is None else row["iteration"], row["phase"]))
+        return rows
+
+    def get_totals(self):
+        """
+        Return the report summed over iterations, by phase.
+        """
+        totals = {}
+        for row in self.get_report():
+            total = totals.setdefault(row["phase"], dict((key, 0) for key in
+                                                         ("calls", "seconds", "points", "infeasible")))
+            for key in total:
+                total[key] += row[key]
+        return totals
+
+    def write_json(self, path):
+        with open(path, "w") as out:
+            json.dump({"phases": self.get_report(), "totals": self.get_totals()}, out, indent=2)
+
+    def write_trace(self, path):
+        """
+        Write kept calls in Chrome trace event format (chrome://tracing).
+        """
+        events = [{"name": phase, "ph": "X", "pid": 0, "tid": 0, "ts": start * 1e6,
+                   "dur": (stop - start) * 1e6, "args": {"iteration": iteration}}
+                  for phase, iteration, start, stop in self._events]
+        with open(path, "w") as out:
+            json.dump({"traceEvents": events}, out)
+
+    def clear(self):
+        self._stats = {}
+        self._events = []
@@ -0,0 +1,214 @@
+"""
+On-disk store of solved economies, keyed by what they were solved from.
+
+    results = store.ResultStore("results")
+    run = results.solve(economy, 1., 1., tolw=.2)
+    economy = run.load_economy()
+    for run in results.runs():
+        print(run.get_meta()["converged"], run.column("pop")[-1])
+
+A key is the sha256 of the model source, the module constants, the
+unsolved economy's arrays (horizon, growth and omega settings, params,
+types and starting fertility), Am, Aa and the big_loop options that
+change the answer. Each run is a directory of one .npy file per column
+of Economy.get_arrays, plus the price path, and a meta.json. Columns
+open memory-mapped, so reading a slice of many runs only touches those
+pages. A run is written to a temporary directory and renamed into place,
+so readers never see half a run.
+"""
+
+__author__ = 'Greg'
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import model
+
+# big_loop options that do not change the solution.
+RUN_OPTIONS = ("report", "workers", "chunksize", "checkpoint", "checkpoint_every", "resume")
+
+
+def code_version():
+    """
+    sha256 of the model source.
+    """
+    with open(inspect.getsourcefile(model), "rb") as source:
+        return hashlib.sha256(source.read()).hexdigest()
+
+
+def _constants():
+    """
+    Module constants of model, by name, as text.
+    """
+    return dict((name, repr(value)) for name, value in vars(model).items()
+                if name.isupper() and isinstance(value, (int, float, tuple, list)))
+
+
+def _keyed_options(options):
+    """
+    big_loop options that change the solution, by name, as text.
+    A HouseholdCache is keyed by its tolerance, not its contents.
+    """
+    keyed = {}
+    for name, value in options.items():
+        if name in RUN_OPTIONS:
+            continue
+        if isinstance(value, model.HouseholdCache):
+            value = ("HouseholdCache", value.get_tolerance())
+        keyed[name] = repr(value)
+    return keyed
+
+
+def _hash_arrays(digest, arrays):
+    for name in sorted(arrays):
+        value = np.ascontiguousarray(arrays[name])
+        digest.update(("%s %s %s\n" % (name, value.dtype.str, value.shape)).encode("utf-8"))
+        digest.update(value.tobytes())
+
+
+class Run:
+    """
+    One stored solve, read lazily from its directory.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._meta = None
+
+    def get_key(self):
+        return os.path.basename(self._path)
+
+    def get_meta(self):
+        """
+        Return the run's key, code version, Am, Aa, options, convergence
+        and residual history.
+        """
+        if self._meta is None:
+            with open(os.path.join(self._path, "meta.json")) as meta:
+                self._meta = json.load(meta)
+        return self._meta
+
+    def get_columns(self):
+        return self.get_meta()["columns"]
+
+    def column(self, name):
+        """
+        Return a column as a read-only memory-mapped array.
+        """
+        if name not in self.get_columns():
+            raise KeyError(name)
+        return np.load(os.path.join(self._path, name + ".npy"), mmap_mode="r", allow_pickle=False)
+
+    def load_economy(self):
+        """
+        Return the solved Economy.
+        """
+        columns = dict((name, self.column(name)) for name in self.get_columns() if name != "prices")
+        return model.economy_from_arrays(columns)[0]
+
+
+class ResultStore:
+    """
+    Directory of Runs, two levels deep by key prefix.
+    """
+
+    def __init__(self, root):
+        self._root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def _path(self, key):
+        return os.path.join(self._root, key[:2], key)
+
+    def key(self, economy, Am, Aa, **options):
+        """
+        Return the key of solving economy, as it is now, from Am and Aa
+        with big_loop options. Raises ValueError for a cache with
+        tolerance > 0 that already holds answers.
+        """
+        cache = options.get("cache")
+        if cache is not None and cache.get_tolerance() and cache.get_stats()[2]:
+            # Rounded answers from earlier solves change this one.
+            raise ValueError("A shared HouseholdCache with tolerance > 0 changes the solution; "
+                             "use an empty cache or tolerance=0")
+        digest = hashlib.sha256()
+        digest.update(code_version().encode("utf-8"))
+        digest.update(json.dumps(_constants(), sort_keys=True).encode("utf-8"))
+        digest.update(json.dumps([repr(float(Am)), repr(float(Aa))] +
+                                 sorted(_keyed_options(options).items())).encode("utf-8"))
+        _hash_arrays(digest, economy.get_arrays())
+        return digest.hexdigest()
+
+    def __contains__(self, key):
+        return os.path.isdir(self._path(key))
+
+    def get(self, key):
+        """
+        Return the Run stored under key. Raises KeyError if there is none.
+        """
+        if key not in self:
+            raise KeyError(key)
+        return Run(self._path(key))
+
+    def keys(self):
+        """
+        Return every stored key, sorted.
+        """
+        return sorted(key for prefix in os.listdir(self._root) if len(prefix) == 2
+                      for key in os.listdir(os.path.join(self._root, prefix)))
+
+    def runs(self):
+        """
+        Yield every stored Run, in key order, without reading any columns.
+        """
+        for key in self.keys():
+            yield Run(self._path(key))
+
+    def solve(self, economy, Am, Aa, **options):
+        """
+        The stored Run for this solve, or solve economy in place with
+        big_loop and store it. A stored run leaves economy as it is;
+        use Run.load_economy for the solved one.
+        """
+        key = self.key(economy, Am, Aa, **options)
+        if key in self:
+            return self.get(key)
+        converged, history = model.big_loop(economy, Am, Aa, **options)
+        return self.put(key, economy, Am, Aa, converged, history, options)
+
+    def put(self, key, economy, Am, Aa, converged, history, options):
+        """
+        Store a solved economy under key and return its Run. If another
+        process stored it first, that run is kept.
+        """
+        start, end = economy.get_horizon()
+        arrays = economy.get_arrays()
+        arrays["prices"] = np.array([economy.get_firms()[t].get_prices() for t in range(start, end + 1)],
+                                    dtype=float).reshape(-1, 3)
+        meta = {"key": key, "code": code_version(), "Am": Am, "Aa": Aa, "converged": converged,
+                "history": [float(residual) for residual in history], "columns": sorted(arrays),
+                "options": _keyed_options(options)}
+
+        path = self._path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        temp = tempfile.mkdtemp(dir=self._root)
+        try:
+            for name, value in arrays.items():
+                np.save(os.path.join(temp, name + ".npy"), np.asarray(value))
+            with open(os.path.join(temp, "meta.json"), "w") as out:
+                json.dump(meta, out, indent=2, sort_keys=True)
+            os.rename(temp, path)
+        except OSError:
+            if key not in self:
+                raise
+        finally:
+            if os.path.isdir(temp):
+                shutil.rmtree(temp)
+        return Run(path)
@@ -0,0 +1,164 @@
+__author__ = 'Greg'
+
+import csv
+import itertools
+
+import model
+
+# Scenario keys, by where they enter the model.
+HOUSEHOLD_KEYS = {"ALPHA": "alpha", "BETA": "beta", "TAU_U": "tau_u", "TAU_S": "tau_s", "CTILDE": "ctilde"}
+ECONOMY_KEYS = {"EPSILON": "epsilon", "B": "bigB", "DELTA": "delta", "ETA_M": "eta_m", "ETA_A": "eta_a"}
+
+# Horizon, starting guesses and big_loop options shared by every scenario.
+SETUP = {"start_time": 0, "end_time": 30, "omega_start": 2, "omega_end": 3,
+         "in_nu": .5, "in_ns": .5, "Am": 1., "Aa": 1., "solver": {"tolw": .2}}
+
+RESULT_COLUMNS = ["converged", "iterations", "residual", "warm_start",
+                  "mean_nu", "mean_ns", "L", "H", "ws", "wu", "pa", "error"]
+
+
+def scenario_grid(grid):
+    """
+    Every combination of the values in grid, a dict of key -> list.
+    """
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[key] for key in keys])]
+
+
+def build_economy(scenario, setup=SETUP):
+    """
+    Economy for one scenario, with cohorts from before start_time so
+    that the first years have parents and workers.
+    """
+    params = model.Individual("low").get_params()
+    params = params._replace(**dict((HOUSEHOLD_KEYS[key], value) for key, value in scenario.items()
+                                    if key in HOUSEHOLD_KEYS))
+    options = dict((ECONOMY_KEYS[key], value) for key, value in scenario.items() if key in ECONOMY_KEYS)
+    for key in scenario:
+        assert key in HOUSEHOLD_KEYS or key in ECONOMY_KEYS, "Unknown scenario key: %s" % key
+    economy = model.Economy(setup["start_time"], setup["end_time"],
+                            omega_start=setup["omega_start"], omega_end=setup["omega_end"],
+                            params=params, **options)
+    economy.add_all_indivs(setup["in_ns"], setup["in_nu"],
+                           setup["start_time"] - params.age_max, setup["end_time"])
+    return economy
+
+
+def solve_scenario(scenario, setup=SETUP, warm=None):
+    """
+    Solve one scenario, starting from the fertility warm if given.
+    A warm start that fails or does not converge is retried from the
+    setup's guesses, and the row's warm_start is then left blank.
+    :return: results row and converged fertility.
+    """
+    economy = build_economy(scenario, setup)
+    year1, year2 = economy.get_decision_years()
+    if warm is not None:
+        economy.set_fertility(year1, year2, warm)
+    row = dict(scenario)
+    try:
+        converged, history = model.big_loop(economy, setup["Am"], setup["Aa"], **setup["solver"])
+    except (AssertionError, ArithmeticError, ValueError) as error:
+        if warm is not None:
+            row, fertility = solve_scenario(scenario, setup)
+            row["warm_start"] = ""
+            return row, fertility
+        row.update(converged=False, error=repr(error))
+        return row, None
+    if warm is not None and not converged:
+        row, fertility = solve_scenario(scenario, setup)
+        row["warm_start"] = ""
+        return row, fertility
+
+    fertility = economy.get_fertility(year1, year2)
+    year = setup["end_time"]
+    L, H = economy.get_pop(year)
+    ws, wu, pa = economy.get_firms()[year].get_prices()
+    row.update(converged=converged, iterations=len(history), residual=history[-1],
+               mean_nu=float(fertility[..., 0].mean()), mean_ns=float(fertility[..., 1].mean()),
+               L=L, H=H, ws=ws, wu=wu, pa=pa, error="")
+    return row, fertility
+
+
+def _solve_scenario(args):
+    """
+    solve_scenario with a single argument, for process pools.
+    """
+    return solve_scenario(*args)
+
+
+def grid_scale(grid):
+    """
+    Range of each key's values in grid, as a float, or 1 for a key
+    with a single value.
+    """
+    return dict((key, float(max(values) - min(values)) or 1.) for key, values in grid.items())
+
+
+def nearest(scenario, solved, scenarios, scale):
+    """
+    Index of the solved scenario closest to scenario, or None.
+    Each key is measured in units of its range across the grid.
+    """
+    best, best_distance = None, float("inf")
+    for i in solved:
+        distance = sum(((scenario[key] - scenarios[i][key]) / scale[key]) ** 2 for key in scenario)
+        if distance < best_distance:
+            best, best_distance = i, distance
+    return best
+
+
+def run_sweep(grid, setup=SETUP, workers=None, path=None):
+    """
+    Solve every scenario in grid and return one row per scenario.
+    Each scenario is warm-started from the nearest one already solved
+    when it is submitted. With workers, scenarios run on a process pool
+    of that size, so which neighbour is available depends on timing.
+    If path is given, the rows are also written there as CSV.
+    """
+    scenarios = scenario_grid(grid)
+    scale = grid_scale(grid)
+    rows = [None] * len(scenarios)
+    solved = {}
+
+    def finish(i, neighbour, result):
+        row, fertility = result
+        row.setdefault("warm_start", "" if neighbour is None else neighbour)
+        rows[i] = row
+        if fertility is not None:
+            solved[i] = fertility
+
+    if not workers:
+        for i, scenario in enumerate(scenarios):
+            neighbour = nearest(scenario, solved, scenarios, scale)
+            finish(i, neighbour, solve_scenario(scenario, setup, solved.get(neighbour)))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+        pending = list(range(len(scenarios)))
+        running = {}
+        with ProcessPoolExecutor(workers) as executor:
+            while pending or running:
+                while pending and len(running) < workers:
+                    i = pending.pop(0)
+                    neighbour = nearest(scenarios[i], solved, scenarios, scale)
+                    args = (scenarios[i], setup, solved.get(neighbour))
+                    running[executor.submit(_solve_scenario, args)] = (i, neighbour)
+                done, waiting = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, neighbour = running.pop(future)
+                    finish(i, neighbour, future.result())
+
+    if path is not None:
+        write_rows(rows, sorted(grid), path)
+    return rows
+
+
+def write_rows(rows, keys, path):
+    """
+    Write sweep rows as CSV, scenario keys first.
+    """
+    with open(path, "w") as out:
+        writer = csv.DictWriter(out, keys + RESULT_COLUMNS, restval="")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)